@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,6 +39,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.SQLInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,8 +48,25 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware',
 ]
 
+# Учет SQL-запросов каждого запроса: заголовок Server-Timing и лог api.sql
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', default='') in (
+    '1', 'True', 'true')
+SQL_SLOW_REQUEST_MS = int(os.getenv('SQL_SLOW_REQUEST_MS', default=500))
+SQL_MAX_QUERIES = int(os.getenv('SQL_MAX_QUERIES', default=30))
+
+# Каталог файлов метрик воркеров для /metrics; пусто - метрики отключены
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+
+# Профилирование запросов (cProfile); пустой PROFILING_DIR - отключено
+PROFILING_DIR = os.getenv('PROFILING_DIR') or None
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default=0))
+PROFILING_RATE_LIMIT = int(os.getenv('PROFILING_RATE_LIMIT', default=10))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', default=100))
+PROFILING_TEXT_LINES = 40
+
 ROOT_URLCONF = 'Foodgram.urls'
 
 TEMPLATES = [
@@ -89,6 +109,49 @@ DATABASES = {
     }
 }
 
+# Кеши должны быть общими для всех воркеров gunicorn: по умолчанию
+# таблицы в базе (manage.py createcachetable), в проде - Redis или
+# memcached. Кеш рецептов в LocMemCache не включается (см. api.cache).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='cache_default'),
+    },
+    'recipes': {
+        'BACKEND': os.getenv(
+            'RECIPE_CACHE_BACKEND',
+            default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.getenv('RECIPE_CACHE_LOCATION',
+                              default='cache_recipes'),
+    },
+}
+
+# Кеш токенов авторизации: LRU в памяти процесса, версии токенов в общем
+# кеше AUTH_TOKEN_CACHE_ALIAS (по умолчанию default; пустое значение
+# выключает кеш). Отозванный токен перестает приниматься другими
+# воркерами не позже чем через AUTH_TOKEN_VERSION_CHECK_INTERVAL секунд.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', default=10000))
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=60))
+AUTH_TOKEN_VERSION_CHECK_INTERVAL = float(
+    os.getenv('AUTH_TOKEN_VERSION_CHECK_INTERVAL', default=5))
+AUTH_TOKEN_CACHE_ALIAS = os.getenv('AUTH_TOKEN_CACHE_ALIAS',
+                                   default='default') or None
+
+# Общая для всех пользователей часть представления рецепта
+RECIPE_CACHE_ALIAS = 'recipes'
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', default=60 * 15))
+
+# Автодополнение ингредиентов (?name=): воркер сверяет версию
+# справочника с базой не чаще раза в указанное число секунд и
+# возвращает не больше INGREDIENT_SEARCH_LIMIT ингредиентов.
+INGREDIENT_INDEX_CHECK_INTERVAL = float(
+    os.getenv('INGREDIENT_INDEX_CHECK_INTERVAL', default=5))
+INGREDIENT_SEARCH_LIMIT = int(
+    os.getenv('INGREDIENT_SEARCH_LIMIT', default=50))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -144,9 +207,50 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Потоки для нарезки вариантов изображений; 0 - обработка в запросе
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', default=2))
+
+# Лента подписок: рецепты раскладываются по лентам подписчиков в фоне
+# (0 потоков - в запросе). Авторы, у которых подписчиков больше
+# FEED_MAX_FANOUT_FOLLOWERS, читаются из ленты напрямую.
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', default=1))
+FEED_MAX_FANOUT_FOLLOWERS = int(
+    os.getenv('FEED_MAX_FANOUT_FOLLOWERS', default=1000))
+# При подписке в ленту попадают только последние рецепты автора
+# (описано в docs/openapi-schema.yml, /api/recipes/feed/).
+FEED_BACKFILL_RECIPES = int(os.getenv('FEED_BACKFILL_RECIPES', default=100))
+FEED_BATCH_SIZE = 1000
+
+# Похожие рецепты: сколько хранить для каждого рецепта и сколько
+# рецептов пересчитывать за одну транзакцию (update_similar_recipes).
+SIMILAR_RECIPES = int(os.getenv('SIMILAR_RECIPES', default=12))
+SIMILAR_RECIPES_CHUNK_SIZE = 500
+
+# Порядок ?ordering=popular и ?ordering=trending: вклад добавления в
+# избранное или корзину вдвое уменьшается за период полураспада.
+# Отсчет сдвигает команда decay_recipe_scores (запускать периодически),
+# а если от него прошло 30 периодов - фоновая задача в SCORE_WORKERS
+# потоках (0 - после фиксации в запросе).
+SCORE_WORKERS = int(os.getenv('SCORE_WORKERS', default=1))
+RECIPE_POPULAR_HALF_LIFE = timedelta(
+    days=float(os.getenv('RECIPE_POPULAR_HALF_LIFE_DAYS', default=30)))
+RECIPE_TRENDING_HALF_LIFE = timedelta(
+    hours=float(os.getenv('RECIPE_TRENDING_HALF_LIFE_HOURS', default=24)))
+
 STATIC_URL = '/staticfiles/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+STORAGES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'MEDIA_STORAGE_BACKEND',
+            default='recipes.storage.ContentAddressedStorage'),
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
 # CSV_FILES_DIR = os.path.join(BASE_DIR, 'data/')
 
 
@@ -163,7 +267,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS': [
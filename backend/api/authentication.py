@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+from users.models import User
+
+from .cache import is_shared_cache
+from .metrics import metrics
+
+SHARED_KEY = 'auth_token:{}'
+VERSION_KEY = 'auth_token_version:{}'
+# Хеш пароля в кеш не попадает; при обращении он догружается из базы.
+USER_FIELDS = [field.attname for field in User._meta.concrete_fields
+               if field.attname != 'password']
+
+
+class TokenCache:
+    """LRU-кеш токен -> пользователь в памяти процесса.
+
+    Работает только с общим для воркеров кешем AUTH_TOKEN_CACHE_ALIAS.
+    У каждого токена там есть версия; запись действительна, пока версия
+    не изменилась. Попадание в LRU сверяет версию с общим кешем не чаще
+    раза в AUTH_TOKEN_VERSION_CHECK_INTERVAL секунд. revoke() удаляет
+    версию: в своем воркере токен перестает работать сразу, в
+    остальных - не позже чем через этот интервал.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _shared_cache():
+        alias = settings.AUTH_TOKEN_CACHE_ALIAS
+        if not alias or not is_shared_cache(caches[alias]):
+            return None
+        return caches[alias]
+
+    def enabled(self):
+        return self._shared_cache() is not None
+
+    @staticmethod
+    def _digest(key):
+        return sha256(key.encode()).hexdigest()
+
+    def _count(self, result):
+        metrics.inc('foodgram_cache_requests_total',
+                    cache='auth_token', result=result)
+
+    def get(self, key):
+        shared = self._shared_cache()
+        digest = self._digest(key)
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._entries.pop(key)
+                entry = None
+            if entry is not None and now - entry[3] < (
+                    settings.AUTH_TOKEN_VERSION_CHECK_INTERVAL):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._count('hit')
+                return entry[2]
+        if entry is not None:
+            version = shared.get(VERSION_KEY.format(digest))
+            cached, result = (entry[1], entry[2]), 'hit'
+        else:
+            found = shared.get_many([SHARED_KEY.format(digest),
+                                     VERSION_KEY.format(digest)])
+            version = found.get(VERSION_KEY.format(digest))
+            cached = found.get(SHARED_KEY.format(digest))
+            result = 'shared_hit'
+        with self._lock:
+            if version is None or cached is None or cached[0] != version:
+                self._entries.pop(key, None)
+                self.misses += 1
+                self._count('miss')
+                return None
+            if result == 'hit':
+                if key in self._entries:
+                    self._entries[key] = (*entry[:3], now)
+                    self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.shared_hits += 1
+            self._count(result)
+        if result == 'shared_hit':
+            self._remember(key, *cached)
+        return cached[1]
+
+    def version(self, key):
+        """Текущая версия токена; берется до чтения токена из базы.
+
+        Если токен отзовут, пока запрос читает базу, версия успеет
+        смениться и записанное значение не будет принято.
+        """
+        shared = self._shared_cache()
+        version_key = VERSION_KEY.format(self._digest(key))
+        shared.add(version_key, uuid4().hex,
+                   settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        return shared.get(version_key)
+
+    def set(self, key, version, value):
+        if version is None:
+            return
+        self._shared_cache().set(SHARED_KEY.format(self._digest(key)),
+                                 (version, value),
+                                 settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        self._remember(key, version, value)
+
+    def _remember(self, key, version, value):
+        now = monotonic()
+        with self._lock:
+            # (истекает, версия, значение, когда сверена версия)
+            self._entries[key] = (
+                now + settings.AUTH_TOKEN_CACHE_TIMEOUT, version, value, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def revoke(self, keys):
+        """Сделать записи токенов недействительными во всех воркерах."""
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        shared = self._shared_cache()
+        if shared and keys:
+            digests = [self._digest(key) for key in keys]
+            shared.delete_many(
+                [VERSION_KEY.format(digest) for digest in digests]
+                + [SHARED_KEY.format(digest) for digest in digests])
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'shared_hits': self.shared_hits,
+                    'misses': self.misses, 'size': len(self._entries)}
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который не ходит в базу за известным токеном.
+
+    В кеше хранятся значения полей, а не сами объекты: каждый запрос
+    получает собственные экземпляры пользователя и токена. Без общего
+    кеша (AUTH_TOKEN_CACHE_ALIAS пуст или указывает на LocMemCache)
+    токен всегда проверяется по базе.
+    """
+
+    def authenticate_credentials(self, key):
+        if not token_cache.enabled():
+            return super().authenticate_credentials(key)
+        cached = token_cache.get(key)
+        if cached is not None:
+            return self.restore(cached)
+        version = token_cache.version(key)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, version, self.dump(user, token))
+        return user, token
+
+    @staticmethod
+    def dump(user, token):
+        return {
+            'user': [getattr(user, name) for name in USER_FIELDS],
+            'token': [getattr(token, field.attname)
+                      for field in token._meta.concrete_fields],
+        }
+
+    def restore(self, cached):
+        model = self.get_model()
+        user = User.from_db(User.objects.db, USER_FIELDS, cached['user'])
+        token = model.from_db(
+            model.objects.db,
+            [field.attname for field in model._meta.concrete_fields],
+            cached['token'])
+        token.user = user
+        return user, token
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from recipes.background import after_commit
+
+from .metrics import metrics
+
+RECIPE_KEY = 'recipe:{}'
+
+
+def is_shared_cache(cache):
+    """Видят ли все воркеры одни и те же записи кеша.
+
+    LocMemCache живет в памяти процесса: сброс записи в одном воркере
+    не доходит до остальных.
+    """
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def recipe_cache():
+    """Кеш представлений рецептов; None, если он не общий для воркеров."""
+    cache = caches[settings.RECIPE_CACHE_ALIAS]
+    return cache if is_shared_cache(cache) else None
+
+
+def get_cached_recipes(recipe_ids):
+    """Общие части представлений рецептов из кеша одним get_many."""
+    keys = {RECIPE_KEY.format(pk): pk for pk in recipe_ids}
+    cache = recipe_cache()
+    if cache is None:
+        return {}
+    found = cache.get_many(keys)
+    metrics.inc('foodgram_cache_requests_total', len(found),
+                cache='recipes', result='hit')
+    metrics.inc('foodgram_cache_requests_total', len(keys) - len(found),
+                cache='recipes', result='miss')
+    return {keys[key]: value for key, value in found.items()}
+
+
+def set_cached_recipes(representations):
+    cache = recipe_cache()
+    if cache is None:
+        return
+    cache.set_many(
+        {RECIPE_KEY.format(pk): data for pk, data in representations.items()},
+        timeout=settings.RECIPE_CACHE_TIMEOUT)
+
+
+def delete_cached_recipes(recipe_ids):
+    cache = recipe_cache()
+    if cache is not None:
+        cache.delete_many([RECIPE_KEY.format(pk) for pk in recipe_ids])
+
+
+def invalidate_recipes(recipe_ids):
+    """Сбросить кеш рецептов после фиксации текущей транзакции."""
+    if recipe_cache() is not None:
+        after_commit(delete_cached_recipes, recipe_ids)
@@ -0,0 +1,139 @@
+from collections import Counter, defaultdict
+from threading import Lock
+
+from django.db import transaction
+
+from recipes.background import after_commit
+from recipes.models import IndexChange, IndexVersion, IngredientRecipe
+
+INDEX_NAME = 'coverage'
+# Сколько последних списков измененных рецептов хранится в базе;
+# воркер, отставший сильнее, перестраивает индекс целиком.
+MAX_CHANGES_BEHIND = 100
+
+
+def publish_changes(recipe_ids):
+    # Версия и список изменений фиксируются вместе: воркер, который
+    # видит версию, видит и ее список.
+    with transaction.atomic():
+        version = IndexVersion.bump(INDEX_NAME)
+        IndexChange.objects.create(index=INDEX_NAME, version=version,
+                                   recipe_ids=sorted(recipe_ids))
+        IndexChange.objects.filter(
+            index=INDEX_NAME,
+            version__lte=version - MAX_CHANGES_BEHIND).delete()
+
+
+class CoverageIndex:
+    """Обратный индекс ингредиент -> рецепты в памяти процесса.
+
+    Отвечает на вопрос "что приготовить из того, что есть": доля
+    ингредиентов рецепта, которые есть у пользователя, считается по
+    спискам рецептов без обращения к базе. После фиксации изменения
+    рецептов записываются в базу как новая версия (IndexVersion) со
+    списком измененных рецептов (IndexChange); воркер перечитывает
+    только эти рецепты.
+    """
+
+    def __init__(self):
+        # _lock защищает только замену и чтение структур в памяти;
+        # чтение базы и полная перестройка идут без него.
+        self._lock = Lock()
+        self._build_lock = Lock()
+        self._version = None
+        self._postings = None
+        self._ingredients = None
+
+    def mark_changed(self, recipe_ids):
+        """Сообщить воркерам об изменении рецептов после фиксации."""
+        after_commit(publish_changes, recipe_ids)
+
+    @staticmethod
+    def _read(recipe_ids=None):
+        rows = IngredientRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id')
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        ingredients = defaultdict(set)
+        for recipe_id, ingredient_id in rows.iterator(chunk_size=10000):
+            ingredients[recipe_id].add(ingredient_id)
+        return ingredients
+
+    def _rebuild(self, version, current):
+        postings = defaultdict(set)
+        ingredients = {}
+        for recipe_id, recipe_ingredients in self._read().items():
+            ingredients[recipe_id] = frozenset(recipe_ingredients)
+            for ingredient_id in recipe_ingredients:
+                postings[ingredient_id].add(recipe_id)
+        with self._lock:
+            if self._version == current:
+                self._postings = postings
+                self._ingredients = ingredients
+                self._version = version
+
+    def _apply(self, recipe_ids, version, current):
+        fresh = self._read(recipe_ids)
+        with self._lock:
+            # Другой поток мог обновить индекс, пока читалась база.
+            if self._version != current:
+                return
+            for recipe_id in recipe_ids:
+                for ingredient_id in self._ingredients.pop(recipe_id, ()):
+                    self._postings[ingredient_id].discard(recipe_id)
+                if recipe_id in fresh:
+                    self._ingredients[recipe_id] = frozenset(
+                        fresh[recipe_id])
+                    for ingredient_id in fresh[recipe_id]:
+                        self._postings[ingredient_id].add(recipe_id)
+            self._version = version
+
+    def _sync(self):
+        version = IndexVersion.current(INDEX_NAME)
+        current = self._version
+        if current is None:
+            # Пока индекс строится впервые, остальным запросам нечего
+            # отдать: они ждут одну перестройку, а не делают свою.
+            with self._build_lock:
+                if self._version is None:
+                    self._rebuild(version, None)
+            return
+        if version == current:
+            return
+        changes = None
+        if current < version <= current + MAX_CHANGES_BEHIND:
+            changes = list(IndexChange.objects.filter(
+                index=INDEX_NAME, version__gt=current,
+                version__lte=version).values_list('recipe_ids', flat=True))
+        if changes is not None and len(changes) == version - current:
+            self._apply({recipe_id for recipe_ids in changes
+                         for recipe_id in recipe_ids}, version, current)
+        elif self._build_lock.acquire(blocking=False):
+            # Пока индекс перестраивается, запросы получают прежний.
+            try:
+                self._rebuild(version, current)
+            finally:
+                self._build_lock.release()
+
+    def rank(self, ingredient_ids, complete=False):
+        """Id рецептов по убыванию доли имеющихся ингредиентов.
+
+        При равной доле выше рецепт, где совпало больше ингредиентов,
+        затем более новый. complete оставляет только рецепты, для
+        которых есть все ингредиенты.
+        """
+        self._sync()
+        with self._lock:
+            matches = Counter()
+            for ingredient_id in set(ingredient_ids):
+                matches.update(self._postings.get(ingredient_id, ()))
+            scored = [
+                (count / len(self._ingredients[recipe_id]), count, recipe_id)
+                for recipe_id, count in matches.items()]
+        if complete:
+            scored = [item for item in scored if item[0] == 1]
+        scored.sort(reverse=True)
+        return [recipe_id for _, _, recipe_id in scored]
+
+
+coverage_index = CoverageIndex()
@@ -1,13 +1,21 @@
 from django_filters.rest_framework import filters, FilterSet
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
+
+
+# Порядок выдачи рецептов по ?ordering=; поля популярности в индексах.
+RECIPE_ORDERINGS = {
+    'popular': ('-popular_score', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
 
 
 class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
-        field_name='tags__slug',
         to_field_name='slug',
+        method='get_tags',
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited'
@@ -15,11 +23,22 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
 
+    def get_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов (по маске тегов рецепта)."""
+        if not value:
+            return queryset
+        return queryset.with_any_tag([tag.pk for tag in value])
+
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
             return queryset.filter(favorites__user=self.request.user)
@@ -30,6 +49,14 @@ class RecipeFilter(FilterSet):
             return queryset.filter(baskets__user=self.request.user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        """Полнотекстовый поиск, самые релевантные рецепты первыми."""
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        """Самые популярные за все время или за последние дни первыми."""
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(lookup_expr='istartswith')
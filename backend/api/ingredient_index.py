@@ -0,0 +1,82 @@
+from bisect import bisect_left
+from itertools import islice
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.db import transaction
+
+from recipes.models import Ingredient, IndexVersion
+
+INDEX_NAME = 'ingredients'
+
+
+class IngredientIndex:
+    """Индекс справочника ингредиентов в памяти процесса для автодополнения.
+
+    Загружается при первом запросе. Версия справочника хранится в базе
+    (IndexVersion) и увеличивается после фиксации изменений, так что
+    каждый воркер перестраивает индекс по уже зафиксированным данным.
+    Воркер сверяет версию не чаще раза в INGREDIENT_INDEX_CHECK_INTERVAL
+    секунд; свои изменения он видит сразу.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._checked_at = None
+        self._keys = None
+        self._items = None
+
+    def invalidate(self):
+        """Сообщить воркерам об изменении справочника после фиксации."""
+        def publish():
+            IndexVersion.bump(INDEX_NAME)
+            self._checked_at = None
+        transaction.on_commit(publish)
+
+    def _load(self):
+        now = monotonic()
+        if self._keys is not None and self._checked_at is not None and (
+                now - self._checked_at
+                < settings.INGREDIENT_INDEX_CHECK_INTERVAL):
+            return self._keys, self._items
+        version = IndexVersion.current(INDEX_NAME)
+        self._checked_at = now
+        if self._keys is not None and version == self._version:
+            return self._keys, self._items
+        with self._lock:
+            if self._keys is None or version != self._version:
+                items = sorted(
+                    ({'id': pk, 'name': name,
+                      'measurement_unit': measurement_unit}
+                     for pk, name, measurement_unit
+                     in Ingredient.objects.values_list(
+                         'id', 'name', 'measurement_unit')),
+                    key=lambda item: (item['name'].casefold(), item['id']))
+                self._keys = [item['name'].casefold() for item in items]
+                self._items = items
+                self._version = version
+            return self._keys, self._items
+
+    def search(self, query, limit=None):
+        """Сначала ингредиенты, начинающиеся с query, затем содержащие его.
+
+        Возвращает не больше limit (INGREDIENT_SEARCH_LIMIT) ингредиентов.
+        """
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        keys, items = self._load()
+        query = query.casefold()
+        start = end = bisect_left(keys, query)
+        while (end < len(keys) and end - start < limit
+               and keys[end].startswith(query)):
+            end += 1
+        found = items[start:end]
+        found.extend(islice(
+            (item for key, item in zip(keys, items)
+             if query in key and not key.startswith(query)),
+            limit - len(found)))
+        return found
+
+
+ingredient_index = IngredientIndex()
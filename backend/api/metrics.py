@@ -0,0 +1,201 @@
+import json
+import mmap
+import os
+import struct
+from collections import defaultdict
+from threading import Lock
+
+from django.conf import settings
+
+# Метрики: тип, описание и границы корзин для гистограмм.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+METRICS = {
+    'foodgram_http_request_duration_seconds': (
+        'histogram', 'Время обработки запроса по view и действию.',
+        DURATION_BUCKETS),
+    'foodgram_http_db_queries': (
+        'histogram', 'Число SQL-запросов на один запрос к API.',
+        QUERY_BUCKETS),
+    'foodgram_http_response_size_bytes': (
+        'histogram', 'Размер тела ответа (кроме потоковых ответов).',
+        SIZE_BUCKETS),
+    'foodgram_cache_requests_total': (
+        'counter', 'Обращения к кешам: попадания и промахи.', None),
+}
+
+INITIAL_FILE_SIZE = 1 << 16
+HEADER = struct.Struct('q')
+LENGTH = struct.Struct('i')
+VALUE = struct.Struct('d')
+
+
+def _padding(length):
+    # Значение float64 выравнивается по 8 байтам от начала записи.
+    return (8 - (LENGTH.size + length) % 8) % 8
+
+
+def read_entries(data):
+    """Пары (ключ, значение) из содержимого файла метрик."""
+    (used,) = HEADER.unpack_from(data, 0)
+    position = HEADER.size
+    while position < used:
+        (length,) = LENGTH.unpack_from(data, position)
+        start = position + LENGTH.size
+        key = data[start:start + length].decode()
+        position = start + length + _padding(length)
+        (value,) = VALUE.unpack_from(data, position)
+        position += VALUE.size
+        yield key, value
+
+
+class MmapedDict:
+    """Значения float64 по строковым ключам в mmap-файле одного процесса.
+
+    Писатель в файле один, поэтому читатели других процессов видят
+    только полностью записанные ключи: размер занятой части в заголовке
+    обновляется после записи ключа.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            self._file.truncate(INITIAL_FILE_SIZE)
+            size = INITIAL_FILE_SIZE
+        self._capacity = size
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._positions = {}
+        (self._used,) = HEADER.unpack_from(self._map, 0)
+        if self._used == 0:
+            self._used = HEADER.size
+            HEADER.pack_into(self._map, 0, self._used)
+        position = HEADER.size
+        for key, _ in read_entries(self._map):
+            length = len(key.encode())
+            position += LENGTH.size + length + _padding(length)
+            self._positions[key] = position
+            position += VALUE.size
+
+    def _add_key(self, key):
+        encoded = key.encode()
+        entry = (LENGTH.pack(len(encoded)) + encoded
+                 + b' ' * _padding(len(encoded)) + VALUE.pack(0.0))
+        if self._used + len(entry) > self._capacity:
+            while self._used + len(entry) > self._capacity:
+                self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._map[self._used:self._used + len(entry)] = entry
+        self._positions[key] = self._used + len(entry) - VALUE.size
+        self._used += len(entry)
+        HEADER.pack_into(self._map, 0, self._used)
+
+    def inc(self, key, amount):
+        if key not in self._positions:
+            self._add_key(key)
+        position = self._positions[key]
+        (value,) = VALUE.unpack_from(self._map, position)
+        VALUE.pack_into(self._map, position, value + amount)
+
+
+class MetricsStore:
+    """Метрики процесса в каталоге METRICS_DIR, по файлу на процесс.
+
+    /metrics суммирует файлы всех процессов, поэтому воркеры gunicorn
+    отдают общие значения без внешнего сборщика.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._pid = None
+        self._values = None
+
+    @staticmethod
+    def enabled():
+        return bool(settings.METRICS_DIR)
+
+    def _process_values(self):
+        # После fork у воркера должен быть собственный файл.
+        if self._pid != os.getpid():
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            self._pid = os.getpid()
+            self._values = MmapedDict(os.path.join(
+                settings.METRICS_DIR, f'{self._pid}.db'))
+        return self._values
+
+    def _inc(self, name, suffix, labels, amount):
+        key = json.dumps([name, suffix, sorted(labels.items())])
+        with self._lock:
+            self._process_values().inc(key, amount)
+
+    def inc(self, name, amount=1, **labels):
+        if self.enabled():
+            self._inc(name, '', labels, amount)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled():
+            return
+        for bound in METRICS[name][2]:
+            if value <= bound:
+                self._inc(name, '_bucket', {**labels, 'le': bound}, 1)
+        self._inc(name, '_bucket', {**labels, 'le': '+Inf'}, 1)
+        self._inc(name, '_sum', labels, value)
+        self._inc(name, '_count', labels, 1)
+
+    @staticmethod
+    def collect():
+        totals = defaultdict(float)
+        for filename in os.listdir(settings.METRICS_DIR):
+            if not filename.endswith('.db'):
+                continue
+            with open(os.path.join(settings.METRICS_DIR, filename),
+                      'rb') as metrics_file:
+                for key, value in read_entries(metrics_file.read()):
+                    totals[key] += value
+        return totals
+
+    def render(self):
+        """Текстовый формат Prometheus 0.0.4."""
+        series = defaultdict(list)
+        if os.path.isdir(settings.METRICS_DIR):
+            for key, value in self.collect().items():
+                name, suffix, labels = json.loads(key)
+                series[name].append((suffix, labels, value))
+        lines = []
+        for name, (kind, description, _) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in sorted(series[name], key=_order):
+                label_text = ','.join(
+                    f'{label}="{_escape(label_value)}"'
+                    for label, label_value in labels)
+                lines.append(
+                    f'{name}{suffix}{{{label_text}}} {_format(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format(value):
+    # Счетчики и суммы выводятся без потери точности (не 1.23457e+06).
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _order(item):
+    suffix, labels, _ = item
+    labels = dict(labels)
+    bound = labels.pop('le', None)
+    bound = float('inf') if bound in (None, '+Inf') else float(bound)
+    return sorted(labels.items()), suffix, bound
+
+
+metrics = MetricsStore()
@@ -0,0 +1,240 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime
+from random import random
+from time import perf_counter, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedTokenAuthentication
+from .metrics import metrics
+
+logger = logging.getLogger('api.sql')
+
+# Сколько самых медленных и повторяющихся запросов попадает в лог.
+REPORTED_STATEMENTS = 3
+
+
+class QueryStats:
+    """Обертка execute_wrapper: считает запросы и время SQL."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.timings = []
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            self.timings.append((duration, sql))
+            self.statements[sql] += 1
+
+    def slowest(self):
+        return [{'ms': round(duration * 1000, 2), 'sql': sql}
+                for duration, sql in sorted(
+                    self.timings, key=lambda item: item[0],
+                    reverse=True)[:REPORTED_STATEMENTS]]
+
+    def duplicates(self):
+        return [{'count': count, 'sql': sql}
+                for sql, count in self.statements.most_common(
+                    REPORTED_STATEMENTS)
+                if count > 1]
+
+
+class SQLInstrumentationMiddleware:
+    """Число и время SQL-запросов для каждого запроса к API.
+
+    Включается настройкой SQL_INSTRUMENTATION; иначе Django исключает
+    middleware из цепочки при старте. Итоги уходят в заголовок
+    Server-Timing и строкой JSON в лог api.sql; запросы сверх порогов
+    SQL_SLOW_REQUEST_MS и SQL_MAX_QUERIES пишутся с уровнем WARNING
+    вместе с самыми медленными и повторяющимися запросами.
+
+    Для потоковых ответов учитываются только запросы до начала
+    отправки тела.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total_ms = (perf_counter() - start) * 1000
+        sql_ms = stats.duration * 1000
+        response['Server-Timing'] = (
+            f'db;dur={sql_ms:.1f};desc="{stats.count} queries", '
+            f'total;dur={total_ms:.1f}')
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': stats.count,
+            'sql_ms': round(sql_ms, 2),
+            'total_ms': round(total_ms, 2),
+        }
+        if (total_ms > settings.SQL_SLOW_REQUEST_MS
+                or stats.count > settings.SQL_MAX_QUERIES):
+            record['slowest'] = stats.slowest()
+            record['duplicates'] = stats.duplicates()
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
+        return response
+
+
+def view_name(view_func, method):
+    """Имя view для метрик: RecipeViewSet.list, download_shopping_cart."""
+    cls = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None)
+    if cls is not None and actions:
+        return f'{cls.__name__}.{actions.get(method.lower(), method.lower())}'
+    if cls is not None:
+        return cls.__name__
+    return f'{view_func.__module__}.{view_func.__name__}'
+
+
+class MetricsMiddleware:
+    """Время ответа, число SQL-запросов и размер ответа по view.
+
+    Включается настройкой METRICS_DIR; значения отдает /metrics.
+    """
+
+    def __init__(self, get_response):
+        if not metrics.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        view = getattr(request, '_metrics_view', 'unresolved')
+        metrics.observe('foodgram_http_request_duration_seconds',
+                        perf_counter() - start, view=view,
+                        method=request.method)
+        metrics.observe('foodgram_http_db_queries', stats.count,
+                        view=view, method=request.method)
+        if not response.streaming:
+            metrics.observe('foodgram_http_response_size_bytes',
+                            len(response.content), view=view,
+                            method=request.method)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = view_name(view_func, request.method)
+
+
+class ProfilingMiddleware:
+    """Профилирование запроса через cProfile по требованию персонала.
+
+    Включается настройкой PROFILING_DIR. Запрос сотрудника (is_staff)
+    с заголовком X-Profile или параметром ?profile= выполняется под
+    профилировщиком; значение text возвращает вместо ответа сводку
+    pstats, любое другое - сохраняет профиль и отдает имя файла в
+    заголовке X-Profile. Доля PROFILING_SAMPLE_RATE остальных запросов
+    профилируется автоматически.
+
+    Профили в формате pstats (snakeviz, flameprof, gprof2dot) лежат в
+    PROFILING_DIR, хранятся последние PROFILING_MAX_FILES. Не больше
+    PROFILING_RATE_LIMIT профилей в минуту (счетчик в кеше default).
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_DIR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = self.requested_mode(request)
+        if mode is None and random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        if not self.acquire_slot():
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+        name = self.store(profiler, request)
+        if mode == 'text':
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats(
+                'cumulative').print_stats(settings.PROFILING_TEXT_LINES)
+            return HttpResponse(stream.getvalue(),
+                                content_type='text/plain; charset=utf-8')
+        if mode is not None:
+            response['X-Profile'] = name
+        return response
+
+    @staticmethod
+    def requested_mode(request):
+        value = (request.headers.get('X-Profile')
+                 or request.GET.get('profile'))
+        if not value or not is_staff(request):
+            return None
+        return 'text' if value == 'text' else 'store'
+
+    @staticmethod
+    def acquire_slot():
+        key = f'profiling:{int(time() // 60)}'
+        cache.add(key, 0, timeout=120)
+        try:
+            return cache.incr(key) <= settings.PROFILING_RATE_LIMIT
+        except ValueError:
+            return False
+
+    @staticmethod
+    def store(profiler, request):
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        slug = request.path.strip('/').replace('/', '_')[:80] or 'root'
+        name = (f'{datetime.now():%Y%m%dT%H%M%S%f}-{os.getpid()}'
+                f'-{request.method}-{slug}.prof')
+        profiler.dump_stats(os.path.join(settings.PROFILING_DIR, name))
+        profiles = sorted(
+            (entry for entry in os.scandir(settings.PROFILING_DIR)
+             if entry.name.endswith('.prof')),
+            key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in profiles[settings.PROFILING_MAX_FILES:]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        return name
+
+
+def is_staff(request):
+    """Сотрудник ли автор запроса (сессия или токен API)."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        result = CachedTokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return result is not None and result[0].is_staff
@@ -1,3 +1,4 @@
+from django.db.models import Count, Value
 from django.shortcuts import get_object_or_404
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
@@ -6,13 +7,39 @@ from rest_framework.response import Response
 
 from users.models import Subscribe, User
 
-from .pagination import CustomPaginator
+from .pagination import CustomPaginator, SubscriptionsCursorPaginator
 from .serializers import (SetPasswordSerializer, SubscribeAuthorSerializer,
                           SubscriptionsSerializer, UserGetSerializer,
                           UserPostSerializer)
 
 
-class UserViewSetMixin(mixins.CreateModelMixin,
+class CursorPaginationMixin:
+    """Курсорная пагинация по запросу клиента.
+
+    Если в запросе есть параметр курсора (для первой страницы - пустой
+    ``?cursor=``), используется cursor_pagination_class, иначе обычная
+    постраничная выдача по page/limit. Параметры из page_number_params
+    задают порядок, который курсор не сохраняет (например, релевантность
+    в ?search=), поэтому с ними выдача всегда постраничная.
+    """
+    cursor_pagination_class = None
+    page_number_params = ()
+
+    @property
+    def paginator(self):
+        if (not hasattr(self, '_paginator')
+                and self.pagination_class is not None
+                and self.cursor_pagination_class is not None
+                and self.cursor_pagination_class.cursor_query_param
+                in self.request.query_params
+                and not any(self.request.query_params.get(param)
+                            for param in self.page_number_params)):
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+
+class UserViewSetMixin(CursorPaginationMixin,
+                       mixins.CreateModelMixin,
                        mixins.ListModelMixin,
                        mixins.RetrieveModelMixin,
                        viewsets.GenericViewSet):
@@ -42,9 +69,13 @@ class UserViewSetMixin(mixins.CreateModelMixin,
 
     @action(detail=False, methods=['get'],
             permission_classes=(IsAuthenticated,),
-            pagination_class=CustomPaginator)
+            pagination_class=CustomPaginator,
+            cursor_pagination_class=SubscriptionsCursorPaginator)
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
+        # Подписка на каждого автора здесь заведомо есть.
+        queryset = User.objects.filter(
+            following__user=request.user
+        ).annotate(recipes_count=Count('recipes'), is_subscribed=Value(True))
         page = self.paginate_queryset(queryset)
         serializer = SubscriptionsSerializer(page, many=True,
                                              context={'request': request})
@@ -60,6 +91,7 @@ class UserViewSetMixin(mixins.CreateModelMixin,
                 following, data=request.data, context={"request": request})
             serializer.is_valid(raise_exception=True)
             Subscribe.objects.create(user=request.user, following=following)
+            following.is_subscribed = True
             # return Response({'detail': 'Тест все ок'})
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
@@ -1,5 +1,27 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from .filters import RECIPE_ORDERINGS
 
 
 class CustomPaginator(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPaginator(CursorPagination):
+    """Курсорная выдача ленты рецептов без COUNT и OFFSET.
+
+    CursorPagination сам сортирует выборку, поэтому порядок из
+    ?ordering= (popular, trending) передается ему здесь.
+    """
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = RECIPE_ORDERINGS.get(request.query_params.get('ordering'))
+        return ordering or super().get_ordering(request, queryset, view)
+
+
+class SubscriptionsCursorPaginator(CursorPagination):
+    """Курсорная выдача авторов, на которых подписан пользователь."""
+    page_size_query_param = 'limit'
+    ordering = ('-id',)
@@ -0,0 +1,55 @@
+import csv
+import json
+
+from rest_framework import renderers
+
+
+class ShoppingCartTextRenderer(renderers.BaseRenderer):
+    """Список покупок в виде текста."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Используется только для ответов с ошибками.
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode(self.charset)
+
+    def stream(self, ingredients):
+        yield 'Cписок покупок:\n'
+        for name, amount, measurement_unit in ingredients:
+            yield f'{name}: {amount} {measurement_unit}.\n'
+
+
+class EchoBuffer:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartCSVRenderer(ShoppingCartTextRenderer):
+    """Список покупок в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(('name', 'amount', 'measurement_unit'))
+        for row in ingredients:
+            yield writer.writerow(row)
+
+
+class ShoppingCartJSONRenderer(renderers.JSONRenderer):
+    """Список покупок в формате JSON."""
+
+    def stream(self, ingredients):
+        separator = '['
+        for name, amount, measurement_unit in ingredients:
+            yield separator + json.dumps(
+                {'name': name, 'amount': amount,
+                 'measurement_unit': measurement_unit},
+                ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
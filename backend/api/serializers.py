@@ -1,14 +1,21 @@
 from django.contrib.auth.password_validation import validate_password
 from django.core import exceptions as django_exceptions
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from recipes.models import (Ingredient, IngredientRecipe, Recipe, Tag,
-                            Favorite,
-                            Basket)
+from recipes.images import variant_urls
+from recipes.models import (RECIPE_EDITABLE_FIELDS, RECIPE_RELATED_LOOKUPS,
+                            Basket, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingListItem, Tag,
+                            recipe_content_hash)
 from users.models import Subscribe, User
 
+from .cache import get_cached_recipes, set_cached_recipes
+
 
 class UserGetSerializer(UserSerializer):
     """Cписок пользователей."""
@@ -21,6 +28,8 @@ class UserGetSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return (
             'request' in self.context
             and self.context.get('request').user.is_authenticated
@@ -116,11 +125,73 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
                   'measurement_unit', 'amount')
 
 
+class RecipeAuthorSerializer(serializers.ModelSerializer):
+    """Автор рецепта без данных о подписке."""
+
+    class Meta:
+        model = User
+        fields = ('email', 'id', 'username',
+                  'first_name', 'last_name')
+
+
+def absolute_variant_urls(variants, request):
+    if request is None:
+        return variants
+    return {
+        variant: {fmt: request.build_absolute_uri(url)
+                  for fmt, url in formats.items()}
+        for variant, formats in variants.items()
+    }
+
+
+class RecipeCachedSerializer(serializers.ModelSerializer):
+    """Общая для всех пользователей часть рецепта, хранится в кеше."""
+    author = RecipeAuthorSerializer(read_only=True)
+    tags = TagSerializer(many=True)
+    image = serializers.ImageField()
+    image_variants = serializers.SerializerMethodField()
+    ingredients = RecipeIngredientSerializer(
+        many=True, read_only=True, source='recipes')
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id',
+            'tags',
+            'author',
+            'ingredients',
+            'name',
+            'image',
+            'image_variants',
+            'text',
+            'cooking_time',
+        )
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj)
+
+
+class RecipeReadListSerializer(serializers.ListSerializer):
+    """Список рецептов: кешированные части читаются одним get_many."""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        cached = get_cached_recipes(recipe.pk for recipe in recipes)
+        missing = [recipe for recipe in recipes if recipe.pk not in cached]
+        if missing:
+            rendered = self.child.render_cached(missing)
+            set_cached_recipes(rendered)
+            cached.update(rendered)
+        return [self.child.add_user_fields(cached[recipe.pk], recipe)
+                for recipe in recipes]
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     """Получить список рецептов"""
     author = UserGetSerializer(read_only=True)
     tags = TagSerializer(many=True)
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     ingredients = RecipeIngredientSerializer(
@@ -137,11 +208,61 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
+        list_serializer_class = RecipeReadListSerializer
+
+    def to_representation(self, instance):
+        if self.context.get('skip_recipe_cache'):
+            return self.add_user_fields(
+                self.render_cached([instance])[instance.pk], instance)
+        data = get_cached_recipes([instance.pk]).get(instance.pk)
+        if data is None:
+            rendered = self.render_cached([instance])
+            set_cached_recipes(rendered)
+            data = rendered[instance.pk]
+        return self.add_user_fields(data, instance)
+
+    @staticmethod
+    def render_cached(recipes):
+        prefetch_related_objects(recipes, *RECIPE_RELATED_LOOKUPS)
+        return {recipe.pk: RecipeCachedSerializer(recipe).data
+                for recipe in recipes}
+
+    def add_user_fields(self, cached, instance):
+        """Дополнить кешированную часть данными текущего пользователя."""
+        request = self.context.get('request')
+        image = cached['image']
+        if image and request is not None:
+            image = request.build_absolute_uri(image)
+        values = {
+            **cached,
+            'author': {
+                **cached['author'],
+                'is_subscribed': self.get_is_subscribed(instance),
+            },
+            'is_favorited': self.get_is_favorited(instance),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(instance),
+            'image': image,
+            'image_variants': absolute_variant_urls(
+                cached['image_variants'], request),
+        }
+        return {field: values[field] for field in self.Meta.fields}
+
+    def get_image_variants(self, obj):
+        return absolute_variant_urls(variant_urls(obj),
+                                     self.context.get('request'))
+
+    def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return self.fields['author'].get_is_subscribed(obj.author)
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return (
             self.context.get('request').user.is_authenticated
             and Favorite.objects.filter(user=self.context['request'].user,
@@ -149,6 +270,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return (
             self.context.get('request').user.is_authenticated
             and Basket.objects.filter(
@@ -160,13 +283,18 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 class RecipeSerializer(serializers.ModelSerializer):
     """Список рецептов без ингридиентов."""
     image = Base64ImageField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
     name = serializers.ReadOnlyField()
     cooking_time = serializers.ReadOnlyField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'name',
-                  'image', 'cooking_time')
+                  'image', 'image_variants', 'cooking_time')
+
+    def get_image_variants(self, obj):
+        return absolute_variant_urls(variant_urls(obj),
+                                     self.context.get('request'))
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
@@ -180,11 +308,34 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class RecipeImageField(Base64ImageField):
+    """Изображение строкой base64 или файлом из multipart/form-data."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            return serializers.ImageField.to_internal_value(self, data)
+        return super().to_internal_value(data)
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """Заменить изображение рецепта."""
+    image = serializers.ImageField()
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+    def to_representation(self, instance):
+        return RecipeReadSerializer(
+            instance,
+            context={**self.context, 'skip_recipe_cache': True}).data
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Добавить, изменить или удалить рецепт рецепт"""
     id = serializers.ReadOnlyField()
     ingredients = RecipeIngredientCreateSerializer(many=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
     tags = serializers.PrimaryKeyRelatedField(many=True,
                                               queryset=Tag.objects.all())
 
@@ -219,13 +370,23 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Введите уникальные ингредиенты.'
             )
+        unknown = ingredient_set - Ingredient.objects.in_bulk(
+            ingredient_set).keys()
+        if unknown:
+            raise serializers.ValidationError(
+                {'ingredients': 'Ингредиенты не найдены: '
+                 + ', '.join(map(str, sorted(unknown)))}
+            )
 
-        recepie_exists = Recipe.objects.filter(
-            name=obj['name'],
-            text=obj['text'],
-            cooking_time=obj['cooking_time']
-        ).exists()
-        if recepie_exists:
+        # При частичном изменении недостающие поля берутся из рецепта.
+        name, text, cooking_time = (
+            obj.get(field, getattr(self.instance, field, None))
+            for field in ('name', 'text', 'cooking_time'))
+        duplicates = Recipe.objects.filter(
+            content_hash=recipe_content_hash(name, text, cooking_time))
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
             raise serializers.ValidationError(
                 'Такой ркцепт уже существует'
             )
@@ -238,16 +399,26 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             )
         return obj
 
-    def set_on_ingredients_tags(self, recipe, tags, ingredients):
+    def set_on_ingredients_tags(self, recipe, tags, ingredients,
+                                old_rows=None):
+        """Записать теги и ингредиенты, меняя только отличающиеся строки."""
         recipe.tags.set(tags)
+        old_rows = old_rows or {}
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        IngredientRecipe.objects.filter(
+            recipe=recipe,
+            ingredient_id__in=old_rows.keys() - amounts.keys()).delete()
+        changed = [row for pk, row in old_rows.items()
+                   if pk in amounts and row.amount != amounts[pk]]
+        for row in changed:
+            row.amount = amounts[row.ingredient_id]
+        IngredientRecipe.objects.bulk_update(changed, ['amount'])
         IngredientRecipe.objects.bulk_create(
-            [IngredientRecipe(
-                recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
-                amount=ingredient['amount']
-            ) for ingredient in ingredients]
+            [IngredientRecipe(recipe=recipe, ingredient_id=pk, amount=amount)
+             for pk, amount in amounts.items() if pk not in old_rows]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
@@ -255,6 +426,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         self.set_on_ingredients_tags(recipe, tags, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.image = validated_data.get('image', instance.image)
         instance.name = validated_data.get('name', instance.name)
@@ -263,16 +435,77 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time', instance.cooking_time)
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        IngredientRecipe.objects.filter(
-            recipe=instance,
-            ingredient__in=instance.ingredients.all()).delete()
-        self.set_on_ingredients_tags(instance, tags, ingredients)
-        instance.save()
+        old_rows = {row.ingredient_id: row for row
+                    in IngredientRecipe.objects.filter(recipe=instance)}
+        old_amounts = {pk: row.amount for pk, row in old_rows.items()}
+        self.set_on_ingredients_tags(instance, tags, ingredients, old_rows)
+        new_amounts = {item['id']: item['amount'] for item in ingredients}
+        ShoppingListItem.objects.change_amounts(
+            instance.baskets.values_list('user_id', flat=True),
+            {pk: new_amounts.get(pk, 0) - old_amounts.get(pk, 0)
+             for pk in old_amounts.keys() | new_amounts.keys()})
+        instance.save(update_fields=RECIPE_EDITABLE_FIELDS)
         return instance
 
     def to_representation(self, instance):
-        return RecipeReadSerializer(instance,
-                                    context=self.context).data
+        # Записанный экземпляр мог устареть (например, после обработки
+        # изображения), поэтому в кеш он не попадает.
+        return RecipeReadSerializer(
+            instance,
+            context={**self.context, 'skip_recipe_cache': True}).data
+
+
+class ShoppingCartBatchSerializer(serializers.Serializer):
+    """Список рецептов для пакетного изменения корзины."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, required=False)
+
+    def validate(self, data):
+        if self.context['request'].method != 'POST':
+            return data
+        if 'recipes' not in data:
+            raise serializers.ValidationError(
+                {'recipes': 'Укажите рецепты.'})
+        unknown = set(data['recipes']) - set(
+            Recipe.objects.filter(pk__in=data['recipes'])
+            .values_list('pk', flat=True))
+        if unknown:
+            raise serializers.ValidationError(
+                {'recipes': 'Рецепты не найдены: '
+                 + ', '.join(map(str, sorted(unknown)))}
+            )
+        return data
+
+
+def get_recipes_limit(request):
+    """Значение recipes_limit из запроса или None, если не задано."""
+    limit = request.query_params.get('recipes_limit', '')
+    return int(limit) if limit.isdigit() else None
+
+
+def author_recipes_prefetch(limit):
+    """Последние рецепты каждого автора одним запросом на страницу.
+
+    Срез в Prefetch Django выполняет оконной функцией
+    ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY pub_date DESC).
+    """
+    queryset = Recipe.objects.order_by('-pub_date', '-id')
+    if limit is not None:
+        queryset = queryset[:limit]
+    return Prefetch('recipes', queryset=queryset, to_attr='limited_recipes')
+
+
+class SubscriptionsListSerializer(serializers.ListSerializer):
+    """Страница авторов: рецепты всех авторов догружаются разом."""
+
+    def to_representation(self, data):
+        authors = list(data.all() if isinstance(data, Manager) else data)
+        prefetch_related_objects(
+            authors,
+            author_recipes_prefetch(
+                get_recipes_limit(self.context['request'])))
+        return super().to_representation(authors)
 
 
 class SubscriptionsSerializer(serializers.ModelSerializer):
@@ -287,8 +520,11 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
                   'username', 'first_name',
                   'last_name', 'is_subscribed',
                   'recipes', 'recipes_count')
+        list_serializer_class = SubscriptionsListSerializer
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return (
             self.context.get('request').user.is_authenticated
             and Subscribe.objects.filter(user=self.context['request'].user,
@@ -296,44 +532,25 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
         )
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
-        serializer = RecipeSerializer(recipes, many=True, read_only=True)
+        if not hasattr(obj, 'limited_recipes'):
+            prefetch_related_objects([obj], author_recipes_prefetch(
+                get_recipes_limit(self.context['request'])))
+        serializer = RecipeSerializer(obj.limited_recipes, many=True,
+                                      read_only=True, context=self.context)
         return serializer.data
 
 
-class SubscribeAuthorSerializer(serializers.ModelSerializer):
+class SubscribeAuthorSerializer(SubscriptionsSerializer):
     """Подписаться / отписаться от автора рецепта."""
     email = serializers.ReadOnlyField()
     username = serializers.ReadOnlyField()
-    is_subscribed = serializers.SerializerMethodField()
-    recipes = RecipeSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField()
-
-    class Meta:
-        model = User
-        fields = ('email', 'id',
-                  'username', 'first_name',
-                  'last_name', 'is_subscribed',
-                  'recipes', 'recipes_count')
 
     def validate(self, obj):
         if (self.context['request'].user == obj):
             raise serializers.ValidationError({'errors': 'Запрещенно.'})
         return obj
-
-    def get_is_subscribed(self, obj):
-        return (
-            self.context.get('request').user.is_authenticated
-            and Subscribe.objects.filter(user=self.context['request'].user,
-                                         following=obj).exists()
-        )
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
@@ -0,0 +1,131 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag, TagRecipe
+from users.models import User
+
+from .authentication import token_cache
+from .cache import invalidate_recipes
+from .coverage_index import coverage_index
+from .ingredient_index import ingredient_index
+from .serializers import RecipeAuthorSerializer
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipes([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(post_save, sender=TagRecipe)
+@receiver(post_delete, sender=TagRecipe)
+def recipe_relation_changed(sender, instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_recipes([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_recipes(instance.recipes.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_recipes(pk_set)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_coverage_changed(sender, instance, **kwargs):
+    # Ингредиенты пишутся bulk_create без сигналов, но вместе с
+    # сохранением рецепта; индекс перечитывает рецепт после фиксации.
+    coverage_index.mark_changed([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def ingredient_row_changed(sender, instance, **kwargs):
+    coverage_index.mark_changed([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_changed(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            coverage_index.mark_changed([instance.pk])
+    elif action == 'pre_clear':
+        coverage_index.mark_changed(
+            instance.recipes.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        coverage_index.mark_changed(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    invalidate_recipes(
+        TagRecipe.objects.filter(tag=instance)
+        .values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    invalidate_recipes(
+        IngredientRecipe.objects.filter(ingredient=instance)
+        .values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_catalogue_changed(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+# Поля автора в кешированном представлении рецепта.
+AUTHOR_FIELDS = RecipeAuthorSerializer.Meta.fields
+
+
+@receiver(pre_save, sender=User)
+def remember_author_fields(sender, instance, update_fields=None, **kwargs):
+    """Вход (last_login) и другие поля не сбрасывают кеш рецептов."""
+    instance._author_fields = None
+    if instance.pk is None or (update_fields is not None
+                               and update_fields.isdisjoint(AUTHOR_FIELDS)):
+        return
+    instance._author_fields = (User.objects.filter(pk=instance.pk)
+                               .values_list(*AUTHOR_FIELDS).first())
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, **kwargs):
+    stored = getattr(instance, '_author_fields', None)
+    if stored is not None and stored != tuple(
+            getattr(instance, field) for field in AUTHOR_FIELDS):
+        invalidate_recipes(
+            Recipe.objects.filter(author=instance)
+            .values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход (djoser token/logout) отзывает токен после фиксации."""
+    keys = [instance.key]
+    transaction.on_commit(lambda: token_cache.revoke(keys))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    """Смена пароля, деактивация и правка профиля отзывают кеш токенов."""
+    if not created:
+        keys = list(Token.objects.filter(user=instance)
+                    .values_list('key', flat=True))
+        if keys:
+            transaction.on_commit(lambda: token_cache.revoke(keys))
@@ -0,0 +1,38 @@
+from django.test import override_settings
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+# Фоновые задачи (варианты изображений, раскладка ленты, сдвиг отсчета
+# популярности) выполняются в потоке теста.
+synchronous = override_settings(IMAGE_VARIANT_WORKERS=0, FEED_WORKERS=0,
+                                SCORE_WORKERS=0)
+
+
+def make_user(username, **kwargs):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        password='Pa55word!', **kwargs)
+
+
+def make_tag(slug):
+    return Tag.objects.create(name=slug, slug=slug,
+                              color=f'#{abs(hash(slug)) % 0xFFFFFF:06X}')
+
+
+def make_ingredient(name, measurement_unit='г'):
+    return Ingredient.objects.create(name=name,
+                                     measurement_unit=measurement_unit)
+
+
+def make_recipe(author, name, ingredients=(), tags=(), **kwargs):
+    """Рецепт без изображения с ингредиентами по 100 единиц."""
+    kwargs.setdefault('text', name)
+    kwargs.setdefault('cooking_time', 10)
+    recipe = Recipe.objects.create(author=author, name=name, **kwargs)
+    IngredientRecipe.objects.bulk_create(
+        [IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=100)
+         for ingredient in ingredients])
+    if tags:
+        recipe.tags.set(tags)
+    return recipe
@@ -0,0 +1,92 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import CachedTokenAuthentication, TokenCache
+
+from .factories import make_user
+
+
+@override_settings(AUTH_TOKEN_CACHE_ALIAS='default',
+                   AUTH_TOKEN_VERSION_CHECK_INTERVAL=0)
+class TokenCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('cook')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        # Кеш другого воркера: свой LRU, общий кеш тот же.
+        self.worker = TokenCache()
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    def cache_in_worker(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.assertIsNotNone(self.worker.get(self.token.key))
+        # Второе обращение - из LRU воркера.
+        self.assertIsNotNone(self.worker.get(self.token.key))
+        self.assertEqual(self.worker.stats()['hits'], 1)
+
+    def test_cached_token_skips_token_query(self):
+        self.assertEqual(self.me().status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            user, token = (CachedTokenAuthentication()
+                           .authenticate_credentials(self.token.key))
+        self.assertFalse([query for query in queries
+                          if 'authtoken_token' in query['sql']])
+        self.assertEqual((user.pk, token.key),
+                         (self.user.pk, self.token.key))
+
+    def test_password_hash_is_not_cached(self):
+        self.assertEqual(self.me().status_code, 200)
+        cached = self.worker.get(self.token.key)
+        self.assertNotIn(self.user.password, cached['user'])
+        user, _ = CachedTokenAuthentication().restore(cached)
+        self.assertIn('password', user.get_deferred_fields())
+
+    def test_logout_revokes_token_in_other_workers(self):
+        self.cache_in_worker()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(
+                self.client.post('/api/auth/token/logout/').status_code, 204)
+        self.assertIsNone(self.worker.get(self.token.key))
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_deactivation_revokes_token_after_commit(self):
+        self.cache_in_worker()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNotNone(self.worker.get(self.token.key))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(self.worker.get(self.token.key))
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_revocation_during_lookup_is_not_cached(self):
+        cache = TokenCache()
+        version = cache.version(self.token.key)
+        # Токен отозван, пока запрос читал его из базы.
+        cache.revoke([self.token.key])
+        cache.set(self.token.key, version, {'user': [], 'token': []})
+        self.assertIsNone(self.worker.get(self.token.key))
+        self.assertIsNone(cache.get(self.token.key))
+
+    @override_settings(AUTH_TOKEN_CACHE_ALIAS=None)
+    def test_disabled_without_shared_cache(self):
+        self.assertFalse(self.worker.enabled())
+        self.assertEqual(self.me().status_code, 200)
+
+    @override_settings(AUTH_TOKEN_VERSION_CHECK_INTERVAL=60)
+    def test_version_is_checked_once_per_interval(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.assertIsNotNone(self.worker.get(self.token.key))
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(self.worker.get(self.token.key))
+        # Свой отзыв воркер видит сразу, не дожидаясь интервала.
+        self.worker.revoke([self.token.key])
+        self.assertIsNone(self.worker.get(self.token.key))
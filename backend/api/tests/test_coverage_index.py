@@ -0,0 +1,104 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from api import coverage_index as module
+from api.coverage_index import CoverageIndex
+from api.views import RankedRecipes
+from recipes.models import IndexChange, IngredientRecipe, Recipe
+
+from .factories import (make_ingredient, make_recipe, make_tag, make_user,
+                        synchronous)
+
+
+@synchronous
+class CoverageIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = make_user('author')
+        cls.egg, cls.milk, cls.flour = (
+            make_ingredient(name) for name in ('яйцо', 'молоко', 'мука'))
+        cls.soup_tag = make_tag('soup')
+        cls.omelette = make_recipe(author, 'Омлет', [cls.egg, cls.milk])
+        cls.pancakes = make_recipe(author, 'Блины',
+                                   [cls.egg, cls.milk, cls.flour],
+                                   tags=[cls.soup_tag])
+        cls.boiled = make_recipe(author, 'Яйцо вкрутую', [cls.egg])
+
+    def add_flour_to_omelette(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.create(
+                recipe=self.omelette, ingredient=self.flour, amount=10)
+
+    def test_rank_by_coverage(self):
+        self.assertEqual(
+            CoverageIndex().rank([self.egg.pk, self.milk.pk]),
+            [self.omelette.pk, self.boiled.pk, self.pancakes.pk])
+        self.assertEqual(
+            CoverageIndex().rank([self.egg.pk, self.milk.pk], complete=True),
+            [self.omelette.pk, self.boiled.pk])
+
+    def test_other_workers_apply_committed_changes(self):
+        worker = CoverageIndex()
+        worker.rank([])
+        self.add_flour_to_omelette()
+        self.assertEqual(IndexChange.objects.count(), 1)
+        with mock.patch.object(worker, '_rebuild') as rebuild:
+            ranked = worker.rank([self.egg.pk, self.milk.pk], complete=True)
+        rebuild.assert_not_called()
+        self.assertEqual(ranked, [self.boiled.pk])
+
+    def test_change_is_published_only_after_commit(self):
+        worker = CoverageIndex()
+        worker.rank([])
+        with self.captureOnCommitCallbacks() as callbacks:
+            IngredientRecipe.objects.filter(recipe=self.boiled).delete()
+        self.assertIn(self.boiled.pk, worker.rank([self.egg.pk]))
+        for callback in callbacks:
+            callback()
+        self.assertNotIn(self.boiled.pk, worker.rank([self.egg.pk]))
+
+    @mock.patch.object(module, 'MAX_CHANGES_BEHIND', 1)
+    def test_lagging_worker_rebuilds(self):
+        worker = CoverageIndex()
+        worker.rank([])
+        self.add_flour_to_omelette()
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.filter(recipe=self.boiled).delete()
+        self.assertEqual(IndexChange.objects.count(), 1)
+        self.assertEqual(
+            worker.rank([self.egg.pk, self.milk.pk, self.flour.pk]),
+            [self.pancakes.pk, self.omelette.pk])
+
+    @mock.patch.object(module, 'MAX_CHANGES_BEHIND', 0)
+    def test_stale_index_is_served_during_rebuild(self):
+        worker = CoverageIndex()
+        worker.rank([])
+        self.add_flour_to_omelette()
+        # Другой поток уже перестраивает индекс.
+        with worker._build_lock:
+            self.assertEqual(
+                worker.rank([self.egg.pk, self.milk.pk], complete=True),
+                [self.omelette.pk, self.boiled.pk])
+        self.assertEqual(
+            worker.rank([self.egg.pk, self.milk.pk], complete=True),
+            [self.boiled.pk])
+
+    def test_filters_limit_ranked_recipes(self):
+        response = self.client.get('/api/recipes/', {
+            'have': f'{self.egg.pk},{self.milk.pk}', 'tags': 'soup'})
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual([recipe['id'] for recipe in data['results']],
+                         [self.pancakes.pk])
+
+    @mock.patch.object(RankedRecipes, 'MAX_FILTERED', 2)
+    def test_filtered_ranking_is_checked_in_one_query(self):
+        ranked = [self.omelette.pk, self.pancakes.pk, self.boiled.pk]
+        recipes = RankedRecipes(Recipe.objects.all(), ranked,
+                                Recipe.objects.exclude(pk=self.pancakes.pk))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(recipes), 1)
+        self.assertEqual([recipe.pk for recipe in recipes[0:2]],
+                         [self.omelette.pk])
@@ -0,0 +1,69 @@
+from django.test import TestCase, override_settings
+
+from api.ingredient_index import IngredientIndex, ingredient_index
+from recipes.models import Ingredient
+
+from .factories import make_ingredient
+
+
+def names(index, query):
+    return [item['name'] for item in index.search(query)]
+
+
+@override_settings(INGREDIENT_INDEX_CHECK_INTERVAL=0)
+class IngredientIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('молоко', 'сгущенное молоко', 'мука'):
+            make_ingredient(name)
+
+    def test_prefix_matches_come_first(self):
+        self.assertEqual(names(IngredientIndex(), 'мол'),
+                         ['молоко', 'сгущенное молоко'])
+
+    def test_endpoint_uses_index(self):
+        response = self.client.get('/api/ingredients/', {'name': 'МУ'})
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['мука'])
+
+    def test_other_workers_rebuild_after_commit(self):
+        # Два экземпляра - индексы двух воркеров.
+        writer, reader = IngredientIndex(), IngredientIndex()
+        self.assertEqual(names(reader, 'соль'), [])
+        with self.captureOnCommitCallbacks() as callbacks:
+            make_ingredient('соль')
+            # До фиксации версия прежняя: индекс не перестраивается.
+            self.assertEqual(names(reader, 'соль'), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(names(reader, 'соль'), ['соль'])
+        self.assertEqual(names(writer, 'соль'), ['соль'])
+
+    def test_explicit_invalidation(self):
+        index = IngredientIndex()
+        self.assertEqual(names(index, 'мука'), ['мука'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.filter(name='мука').update(name='мак')
+            # update() не шлет сигналов, как и load_csv.
+            index.invalidate()
+        self.assertEqual(names(index, 'мука'), [])
+        self.assertEqual(names(index, 'мак'), ['мак'])
+
+    def test_results_are_limited(self):
+        self.assertEqual(
+            [item['name'] for item in IngredientIndex().search('м', 2)],
+            ['молоко', 'мука'])
+        self.assertEqual(
+            [item['name'] for item in IngredientIndex().search('о', 1)],
+            ['молоко'])
+
+    @override_settings(INGREDIENT_INDEX_CHECK_INTERVAL=60)
+    def test_version_is_checked_at_most_once_per_interval(self):
+        names(ingredient_index, 'мука')
+        with self.assertNumQueries(0):
+            names(ingredient_index, 'мол')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_ingredient('мускат')
+        # Свое изменение воркер видит сразу.
+        self.assertEqual(names(ingredient_index, 'мус'), ['мускат'])
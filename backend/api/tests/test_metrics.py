@@ -0,0 +1,30 @@
+from tempfile import TemporaryDirectory
+
+from django.test import SimpleTestCase, override_settings
+
+from api.metrics import MetricsStore
+
+
+class MetricsRenderTests(SimpleTestCase):
+
+    def setUp(self):
+        metrics_dir = TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+        settings = override_settings(METRICS_DIR=metrics_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.metrics = MetricsStore()
+
+    def test_large_and_fractional_values_keep_precision(self):
+        for size in (1234567, 2000000):
+            self.metrics.observe('foodgram_http_response_size_bytes', size,
+                                 view='recipes')
+        self.metrics.observe('foodgram_http_request_duration_seconds',
+                             0.1234567, view='recipes')
+        lines = self.metrics.render().splitlines()
+        self.assertIn('foodgram_http_response_size_bytes_sum'
+                      '{view="recipes"} 3234567', lines)
+        self.assertIn('foodgram_http_response_size_bytes_count'
+                      '{view="recipes"} 2', lines)
+        self.assertIn('foodgram_http_request_duration_seconds_sum'
+                      '{view="recipes"} 0.1234567', lines)
@@ -0,0 +1,61 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+
+from .factories import make_recipe, make_user, synchronous
+
+
+@synchronous
+class RecipeCursorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = make_user('author')
+        cls.recipes = [make_recipe(author, f'Рецепт {number}')
+                       for number in range(5)]
+        for score, recipe in zip((3, 5, 1, 4, 2), cls.recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                popular_score=score, trending_score=-score)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def walk(self, **params):
+        """Id рецептов всех страниц по ссылкам next."""
+        response = self.client.get('/api/recipes/',
+                                   {'cursor': '', 'limit': 2, **params})
+        ids = []
+        while True:
+            data = response.json()
+            self.assertNotIn('count', data)
+            ids.extend(recipe['id'] for recipe in data['results'])
+            if not data['next']:
+                return ids
+            response = self.client.get(data['next'])
+
+    def test_default_order_is_newest_first(self):
+        self.assertEqual(self.walk(),
+                         [recipe.pk for recipe in reversed(self.recipes)])
+
+    def test_cursor_keeps_requested_ordering(self):
+        by_score = [self.recipes[index].pk for index in (1, 3, 0, 4, 2)]
+        self.assertEqual(self.walk(ordering='popular'), by_score)
+        self.assertEqual(self.walk(ordering='trending'), by_score[::-1])
+
+    def test_page_number_mode_still_counts(self):
+        data = self.client.get('/api/recipes/',
+                               {'page': 2, 'limit': 2}).json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(len(data['results']), 2)
+
+    def test_search_keeps_relevance_order(self):
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            name='Суп', text='Суп с супом')
+        Recipe.objects.filter(pk=self.recipes[4].pk).update(
+            text='Подать к супу')
+        data = self.client.get('/api/recipes/', {
+            'cursor': '', 'limit': 2, 'search': 'суп'}).json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([recipe['id'] for recipe in data['results']],
+                         [self.recipes[0].pk, self.recipes[4].pk])
@@ -0,0 +1,69 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.cache import get_cached_recipes, set_cached_recipes
+
+from .factories import make_ingredient, make_recipe, make_user, synchronous
+
+
+@synchronous
+class RecipeCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.salt = make_ingredient('соль')
+        cls.recipe = make_recipe(cls.author, 'Суп', [cls.salt])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get_name(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['name']
+
+    def test_representation_is_cached(self):
+        self.get_name()
+        self.assertIn(self.recipe.pk, get_cached_recipes([self.recipe.pk]))
+
+    def test_edit_invalidates_after_commit(self):
+        self.assertEqual(self.get_name(), 'Суп')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Борщ'
+            self.recipe.save()
+        self.assertEqual(get_cached_recipes([self.recipe.pk]), {})
+        self.assertEqual(self.get_name(), 'Борщ')
+
+    def test_ingredient_rename_invalidates(self):
+        self.get_name()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salt.name = 'морская соль'
+            self.salt.save()
+        self.assertEqual(get_cached_recipes([self.recipe.pk]), {})
+
+    def test_author_rename_invalidates(self):
+        self.get_name()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Иван'
+            self.author.save()
+        self.assertEqual(get_cached_recipes([self.recipe.pk]), {})
+
+    def test_login_and_other_fields_keep_cache(self):
+        self.get_name()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.client.login(username='author',
+                                              password='Pa55word!'))
+            self.author.is_staff = True
+            self.author.save()
+        self.assertIn(self.recipe.pk, get_cached_recipes([self.recipe.pk]))
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'recipes': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    })
+    def test_process_local_cache_is_not_used(self):
+        set_cached_recipes({self.recipe.pk: {'name': 'Суп'}})
+        self.assertEqual(get_cached_recipes([self.recipe.pk]), {})
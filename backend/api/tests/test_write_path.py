@@ -0,0 +1,91 @@
+from django.db import connection
+from django.db.models.signals import pre_save
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+
+from .factories import (make_ingredient, make_recipe, make_tag, make_user,
+                        synchronous)
+
+
+@synchronous
+class RecipeWritePathTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.tag = make_tag('breakfast')
+        cls.ingredients = [make_ingredient(f'ингредиент {number}')
+                           for number in range(80)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def count_update_queries(self, size):
+        """Половина ингредиентов остается, остальные заменяются."""
+        recipe = make_recipe(self.author, f'Рецепт {size}',
+                             self.ingredients[:size], [self.tag])
+        ingredients = (self.ingredients[:size // 2]
+                       + self.ingredients[size:2 * size - size // 2])
+        payload = {
+            'name': recipe.name, 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': ingredient.pk, 'amount': 10}
+                            for ingredient in ingredients],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    f'/api/recipes/{recipe.pk}/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            sorted(item['id'] for item in response.json()['ingredients']),
+            sorted(ingredient.pk for ingredient in ingredients))
+        return len(queries)
+
+    def test_update_queries_do_not_grow_with_ingredients(self):
+        self.assertEqual(self.count_update_queries(4),
+                         self.count_update_queries(40))
+
+    def test_update_keeps_concurrently_changed_columns(self):
+        recipe = make_recipe(self.author, 'Суп', self.ingredients[:2],
+                             [self.tag])
+
+        def concurrent_writes(sender, instance, **kwargs):
+            # Избранное и варианты изображения записаны после того,
+            # как запрос загрузил рецепт.
+            Recipe.objects.filter(pk=instance.pk).update(
+                popular_score=5, image_variants={'source': 'x'})
+        pre_save.connect(concurrent_writes, sender=Recipe)
+        self.addCleanup(pre_save.disconnect, concurrent_writes,
+                        sender=Recipe)
+        response = self.client.patch(f'/api/recipes/{recipe.pk}/', {
+            'name': 'Борщ', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredients[0].pk, 'amount': 10}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            Recipe.objects.values_list(
+                'name', 'popular_score', 'image_variants').get(pk=recipe.pk),
+            ('Борщ', 5, {'source': 'x'}))
+
+    def test_partial_update_checks_duplicates_with_stored_fields(self):
+        make_recipe(self.author, 'Суп', self.ingredients[:1], [self.tag],
+                    text='Описание', cooking_time=10)
+        recipe = make_recipe(self.author, 'Суп', self.ingredients[:1],
+                             [self.tag], text='Описание', cooking_time=20)
+        payload = {
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredients[0].pk, 'amount': 10}],
+        }
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/', {**payload, 'cooking_time': 10},
+            format='json')
+        self.assertEqual(response.status_code, 400, response.content)
@@ -1,24 +1,76 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.models import (Basket, Favorite, Ingredient, IngredientRecipe,
-                            Recipe, Tag)
+from recipes.feed import feed_recipes
+from recipes.models import (Basket, Favorite, Ingredient, Recipe,
+                            ShoppingListItem, Tag)
 from users.models import User
 
+from .coverage_index import coverage_index
 from .filters import IngredientFilter, RecipeFilter
-from .mixins import UserViewSetMixin
-from .pagination import CustomPaginator
+from .ingredient_index import ingredient_index
+from .metrics import metrics
+from .mixins import CursorPaginationMixin, UserViewSetMixin
+from .pagination import CustomPaginator, RecipeCursorPaginator
+from .parsers import RawImageUploadParser
 from .permissions import IsAuthorOrReadOnly
+from .renderers import (ShoppingCartCSVRenderer, ShoppingCartJSONRenderer,
+                        ShoppingCartTextRenderer)
 from .serializers import (IngredientSerializer, RecipeCreateSerializer,
-                          RecipeReadSerializer, RecipeSerializer,
+                          RecipeImageSerializer, RecipeReadSerializer,
+                          RecipeSerializer, ShoppingCartBatchSerializer,
                           TagSerializer)
 
+SHOPPING_CART_CHUNK_SIZE = 500
+TRUE_VALUES = ('1', 'true', 'True')
+
+
+class RankedRecipes:
+    """Рецепты в порядке списка id; из базы читается только срез.
+
+    Если задан filtered (выборка с фильтрами запроса), в выдачу
+    попадают только рецепты из нее среди первых MAX_FILTERED по
+    рейтингу: их проверяет один запрос, а не загрузка всех подходящих
+    под фильтр рецептов или проверка всего рейтинга.
+    """
+    MAX_FILTERED = 5000
+
+    def __init__(self, queryset, recipe_ids, filtered=None):
+        self.queryset = queryset
+        self.recipe_ids = recipe_ids
+        self.filtered = filtered
+        self._allowed = None
+
+    def _allowed_ids(self):
+        if self._allowed is None:
+            candidates = self.recipe_ids[:self.MAX_FILTERED]
+            allowed = set(self.filtered.filter(pk__in=candidates)
+                          .values_list('pk', flat=True))
+            self._allowed = [pk for pk in candidates if pk in allowed]
+        return self._allowed
+
+    def __len__(self):
+        if self.filtered is None:
+            return len(self.recipe_ids)
+        return len(self._allowed_ids())
+
+    def __getitem__(self, index):
+        if self.filtered is None:
+            recipe_ids = self.recipe_ids[index]
+        else:
+            recipe_ids = self._allowed_ids()[index]
+        recipes = self.queryset.in_bulk(recipe_ids)
+        # Рецепт, удаленный до обновления индекса, пропускается.
+        return [recipes[pk] for pk in recipe_ids if pk in recipes]
+
 
 class UserViewSet(UserViewSetMixin):
     queryset = User.objects.all()
@@ -34,43 +86,143 @@ class TagViewSet(viewsets.ModelViewSet):
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all().order_by('-pub_date')
     permission_classes = (IsAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     search_fields = ('name',)
     pagination_class = CustomPaginator
+    cursor_pagination_class = RecipeCursorPaginator
+    page_number_params = ('search',)
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Загружаемые изображения (multipart и тело PUT .../image/)
+        # пишутся потоком во временный файл, а не в память.
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_queryset(self):
+        # Теги и ингредиенты догружаются сериализатором только
+        # для рецептов, которых нет в кеше представлений.
+        return (super().get_queryset()
+                .select_related('author')
+                .with_user_flags(self.request.user))
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeCreateSerializer
         return RecipeReadSerializer
 
+    def list(self, request, *args, **kwargs):
+        if 'have' in request.query_params:
+            return self.list_by_coverage(request)
+        return super().list(request, *args, **kwargs)
+
+    def list_by_coverage(self, request):
+        """Рецепты по доле ингредиентов из ?have=, которые уже есть.
+
+        ?complete=1 оставляет только рецепты, для которых есть все
+        ингредиенты. Остальные фильтры ограничивают выдачу, но порядок
+        задает доля совпавших ингредиентов.
+        """
+        try:
+            have = [int(value)
+                    for values in request.query_params.getlist('have')
+                    for value in values.split(',') if value.strip()]
+        except ValueError:
+            raise ValidationError(
+                {'have': 'Укажите id ингредиентов через запятую.'})
+        recipe_ids = coverage_index.rank(
+            have, request.query_params.get('complete') in TRUE_VALUES)
+        filtered = None
+        if any(name in request.query_params
+               for name in self.filterset_class.base_filters):
+            filtered = self.filter_queryset(
+                Recipe.objects.all()).order_by()
+        paginator = CustomPaginator()
+        page = paginator.paginate_queryset(
+            RankedRecipes(self.get_queryset().order_by(), recipe_ids,
+                          filtered),
+            request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     def perform_create(self, serializer):
         """Переопределение сохранения объекта"""
         serializer.save(author=self.request.user)
 
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            pagination_class=RecipeCursorPaginator)
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь."""
+        queryset = self.filter_queryset(
+            feed_recipes(self.get_queryset(), request.user))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], pagination_class=None)
+    def similar(self, request, pk=None):
+        """Похожие рецепты по общим ингредиентам, самые похожие первыми.
+
+        Список готовит команда update_similar_recipes; ?limit= урезает его.
+        """
+        # Id из URL проверяется так же, как в get_object: /abc/ - 404.
+        recipe = self.get_object()
+        recipes = Recipe.objects.filter(
+            similar_to__recipe=recipe).order_by('-similar_to__score', '-id')
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            try:
+                recipes = recipes[:max(int(limit), 0)]
+            except ValueError:
+                raise ValidationError({'limit': 'Укажите целое число.'})
+        serializer = RecipeSerializer(recipes, many=True,
+                                      context={'request': request})
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['put'], url_path='image',
+            parser_classes=(RawImageUploadParser,))
+    def upload_image(self, request, **kwargs):
+        """Заменить изображение рецепта телом запроса (image/*)."""
+        recipe = self.get_object()
+        serializer = RecipeImageSerializer(
+            recipe, data={'image': request.data.get('file')},
+            context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        # Файл и ссылка на него из рецепта фиксируются вместе.
+        with transaction.atomic():
+            serializer.save()
+        # Варианты могли уже появиться, если они строятся синхронно.
+        recipe.refresh_from_db(fields=['image_variants'])
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-
         if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=kwargs['pk'])
             serializer = RecipeSerializer(recipe, data=request.data,
                                           context={"request": request})
             serializer.is_valid(raise_exception=True)
-            if not Favorite.objects.filter(user=request.user,
-                                           recipe=recipe).exists():
-                Favorite.objects.create(user=request.user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response({'errors': 'Рецепт был ранее добавлен.'},
-                            status=status.HTTP_400_BAD_REQUEST)
+            # Уникальность проверяет сама вставка: повторный запрос,
+            # пришедший одновременно с первым, получит 400, а не 500.
+            try:
+                with transaction.atomic():
+                    Favorite.objects.create(user=request.user, recipe=recipe)
+            except IntegrityError:
+                return Response({'errors': 'Рецепт был ранее добавлен.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            return Response(serializer.data,
+                            status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            get_object_or_404(Favorite, user=request.user,
-                              recipe=recipe).delete()
+            deleted, _ = Favorite.objects.filter(
+                user=request.user, recipe_id=kwargs['pk']).delete()
+            if not deleted:
+                raise Http404
             return Response({'detail': 'Рецепт  удален из списка избранного.'},
                             status=status.HTTP_204_NO_CONTENT)
 
@@ -79,15 +231,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
             pagination_class=None
             )
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-
         if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=kwargs['pk'])
             serializer = RecipeSerializer(recipe, data=request.data,
                                           context={"request": request})
             serializer.is_valid(raise_exception=True)
-            if not Basket.objects.filter(user=request.user,
-                                         recipe=recipe).exists():
-                Basket.objects.create(user=request.user, recipe=recipe)
+            if Basket.objects.add_recipes(request.user, [recipe.pk]):
                 return Response(serializer.data,
                                 status=status.HTTP_201_CREATED)
             return Response(
@@ -95,33 +244,67 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST)
 
         if request.method == 'DELETE':
-            get_object_or_404(Basket, user=request.user,
-                              recipe=recipe).delete()
+            if not Basket.objects.remove_recipes(request.user,
+                                                 [kwargs['pk']]):
+                raise Http404
             return Response(
                 {'detail': 'Рецепт удален из корзины.'},
                 status=status.HTTP_204_NO_CONTENT
             )
 
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        """Добавить или убрать из корзины список рецептов.
+
+        DELETE без списка recipes очищает корзину целиком.
+        """
+        serializer = ShoppingCartBatchSerializer(
+            data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data.get('recipes')
+
+        if request.method == 'POST':
+            added = Basket.objects.add_recipes(request.user, recipe_ids)
+            if not added:
+                return Response(
+                    {'errors': 'Рецепты были ранее добавлены в корзину.'},
+                    status=status.HTTP_400_BAD_REQUEST)
+            serializer = RecipeSerializer(
+                Recipe.objects.filter(pk__in=added), many=True,
+                context={'request': request})
+            return Response(serializer.data,
+                            status=status.HTTP_201_CREATED)
+
+        if request.method == 'DELETE':
+            deleted = Basket.objects.remove_recipes(request.user, recipe_ids)
+            return Response(
+                {'detail': f'Рецептов удалено из корзины: {deleted}.'},
+                status=status.HTTP_204_NO_CONTENT
+            )
+
     @action(detail=False, methods=['get'],
-            permission_classes=(IsAuthenticated,)
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(ShoppingCartTextRenderer,
+                              ShoppingCartCSVRenderer,
+                              ShoppingCartJSONRenderer)
             )
     def download_shopping_cart(self, request, **kwargs):
+        """Список покупок: ?format=txt|csv|json, отдается потоком."""
         ingredients = (
-            IngredientRecipe.objects
-            .filter(recipe__baskets__user=request.user)
-            .values('ingredient')
-            .annotate(total_amount=Sum('amount'))
+            ShoppingListItem.objects
+            .filter(user=request.user)
             .values_list('ingredient__name', 'total_amount',
-                         'ingredient__measurement_unit'))
-        shopping_list = []
-        for ingredient in ingredients:
-            shopping_list.append(
-                f"{ingredient[0]}: {ingredient[1]} {ingredient[2]}.")
-        response = HttpResponse(
-            'Cписок покупок:\n' + '\n'.join(map(str, shopping_list)),
-            content_type='text/plain')
-        response['Content-Disposition'] = \
-            'attachment; filename="shopping_cart.txt"'
+                         'ingredient__measurement_unit')
+            .order_by('ingredient__name')
+            .iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE))
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients),
+            content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"')
         return response
 
 
@@ -133,3 +316,18 @@ class IngredientViewSet(viewsets.ModelViewSet):
     permission_classes = (AllowAny, )
     search_fields = ('name',)
     pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
+
+def metrics_view(request):
+    """Метрики всех воркеров в формате Prometheus."""
+    if not metrics.enabled():
+        raise Http404
+    return HttpResponse(metrics.render(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
@@ -0,0 +1,115 @@
+"""Замеры производительности на временной тестовой базе.
+
+Запуск из каталога backend, например:
+    python -m benchmarks.ingredient_search
+
+Данные создаются в отдельной базе test_<DB_NAME>, а файлы - во
+временном MEDIA_ROOT; после замера и то и другое удаляется, рабочие
+база и медиафайлы не затрагиваются.
+"""
+import os
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory
+from statistics import median
+from time import perf_counter
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Foodgram.settings')
+    django.setup()
+
+
+@contextmanager
+def temporary_database():
+    from django.test.utils import (override_settings, setup_databases,
+                                   teardown_databases)
+    with TemporaryDirectory() as media_root, \
+            override_settings(MEDIA_ROOT=media_root):
+        config = setup_databases(verbosity=0, interactive=False)
+        try:
+            yield
+        finally:
+            teardown_databases(config, verbosity=0)
+
+
+def png_bytes(width=1, height=1, noise=False):
+    """PNG заданного размера; noise - несжимаемое содержимое."""
+    from io import BytesIO
+
+    from PIL import Image
+
+    if noise:
+        image = Image.frombytes('RGB', (width, height),
+                                os.urandom(width * height * 3))
+    else:
+        image = Image.new('RGB', (width, height), 'white')
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def without_image_processing():
+    """Не строить варианты изображений: их запросы идут в другом потоке."""
+    from django.db.models.signals import post_save
+
+    from recipes.models import Recipe
+    from recipes.signals import process_image
+
+    post_save.disconnect(process_image, sender=Recipe)
+
+
+def create_recipes(author, count, batch_size=1000, **fields):
+    """count рецептов автора, опубликованных с интервалом в минуту.
+
+    Даты публикации задаются явно (auto_now_add дал бы всем одну дату);
+    fields - дополнительные поля: значение или функция номера рецепта.
+    """
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from recipes.models import Recipe
+
+    start = timezone.now()
+    pub_date = Recipe._meta.get_field('pub_date')
+    pub_date.auto_now_add = False
+    try:
+        for first in range(0, count, batch_size):
+            Recipe.objects.bulk_create([
+                Recipe(author=author, name=f'Рецепт {number}',
+                       text=f'Описание рецепта {number}', cooking_time=10,
+                       pub_date=start - timedelta(minutes=number),
+                       **{name: value(number) if callable(value) else value
+                          for name, value in fields.items()})
+                for number in range(first, min(first + batch_size, count))
+            ])
+    finally:
+        pub_date.auto_now_add = True
+
+
+def measure(func, repeat=50):
+    """Медианное время вызова func в миллисекундах."""
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        timings.append((perf_counter() - start) * 1000)
+    return median(timings)
+
+
+def count_queries(func):
+    """Количество SQL-запросов, выполненных func."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+def report(title, rows):
+    print(title)
+    width = max(len(name) for name, _ in rows)
+    for name, value in rows:
+        print(f'  {name:<{width}}  {value}')
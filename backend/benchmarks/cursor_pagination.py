@@ -0,0 +1,65 @@
+"""Постраничная выдача рецептов: page/limit против курсора.
+
+    python -m benchmarks.cursor_pagination [--recipes 60000]
+
+Первая и 10 000-я страницы по 6 рецептов. Курсор глубокой страницы
+строится по последнему рецепту предыдущей страницы, как его вернула
+бы ссылка next.
+"""
+from argparse import ArgumentParser
+
+from . import (count_queries, create_recipes, measure, report, setup,
+               temporary_database)
+
+LIMIT = 6
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--recipes', type=int, default=60000)
+    parser.add_argument('--page', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    options = parser.parse_args()
+    setup()
+    from django.test import Client
+    from rest_framework.pagination import Cursor
+
+    from api.pagination import RecipeCursorPaginator
+    from recipes.models import Recipe
+    from users.models import User
+
+    with temporary_database():
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='x')
+        create_recipes(author, options.recipes)
+        page = min(options.page, options.recipes // LIMIT)
+        paginator = RecipeCursorPaginator()
+        paginator.base_url = f'http://testserver/api/recipes/?limit={LIMIT}'
+        previous = Recipe.objects.order_by('-pub_date', '-id')[
+            (page - 1) * LIMIT - 1]
+        requests = {
+            'page=1': {'page': 1, 'limit': LIMIT},
+            f'page={page}': {'page': page, 'limit': LIMIT},
+            'cursor, первая': {'cursor': '', 'limit': LIMIT},
+            f'cursor, страница {page}': paginator.encode_cursor(Cursor(
+                offset=0, reverse=False,
+                position=str(previous.pub_date))),
+        }
+        client = Client()
+        rows = []
+        for name, params in requests.items():
+            def get():
+                if isinstance(params, str):
+                    response = client.get(params)
+                else:
+                    response = client.get('/api/recipes/', params)
+                assert response.status_code == 200, response.content
+            get()
+            rows.append((name, f'{measure(get, options.repeat):8.2f} мс, '
+                               f'запросов {count_queries(get)}'))
+        report(f'Выдача из {options.recipes} рецептов по {LIMIT}, '
+               f'медиана из {options.repeat}:', rows)
+
+
+if __name__ == '__main__':
+    main()
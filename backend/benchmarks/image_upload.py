@@ -0,0 +1,96 @@
+"""Пиковая память воркера при загрузке изображения рецепта.
+
+    python -m benchmarks.image_upload [--sizes 1 4 16]
+
+Сравниваются создание рецепта с изображением base64 в JSON, то же
+через multipart/form-data и замена изображения телом PUT
+/api/recipes/{id}/image/. Тело запроса собирается до замера, так что
+в пик входит только обработка; изображения - несжимаемый PNG
+заданного размера в мегабайтах.
+"""
+import tracemalloc
+from argparse import ArgumentParser
+from base64 import b64encode
+from itertools import count
+
+from . import (png_bytes, report, setup, temporary_database,
+               without_image_processing)
+
+MEGABYTE = 1024 * 1024
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 16])
+    options = parser.parse_args()
+    setup()
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from api.views import RecipeViewSet
+    from recipes.models import Ingredient, Tag
+    from users.models import User
+
+    without_image_processing()
+    factory = APIRequestFactory()
+    create = RecipeViewSet.as_view({'post': 'create'})
+    upload = RecipeViewSet.as_view({'put': 'upload_image'},
+                                   **RecipeViewSet.upload_image.kwargs)
+    names = count()
+    with temporary_database():
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='x')
+        tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+
+        def fields():
+            return {'name': f'Рецепт {next(names)}', 'text': 'Описание',
+                    'cooking_time': 10}
+
+        def json_request(image):
+            return factory.post('/api/recipes/', {
+                **fields(), 'tags': [tag.pk],
+                'ingredients': [{'id': ingredient.pk, 'amount': 10}],
+                'image': 'data:image/png;base64,' + b64encode(image).decode(),
+            }, format='json')
+
+        def multipart_request(image):
+            return factory.post('/api/recipes/', {
+                **fields(), 'tags': [tag.pk],
+                'ingredients[0]id': ingredient.pk,
+                'ingredients[0]amount': 10,
+                'image': SimpleUploadedFile('image.png', image, 'image/png'),
+            }, format='multipart')
+
+        def peak(request, view, **kwargs):
+            """Прирост памяти в пике обработки запроса, МБ."""
+            force_authenticate(request, author)
+            tracemalloc.start()
+            baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            response = view(request, **kwargs)
+            _, top = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert response.status_code in (200, 201), response.data
+            return response, (top - baseline) / MEGABYTE
+
+        rows = []
+        for size in options.sizes:
+            side = int((size * MEGABYTE / 3) ** 0.5)
+            image = png_bytes(side, side, noise=True)
+            response, json_peak = peak(json_request(image), create)
+            _, multipart_peak = peak(multipart_request(image), create)
+            _, raw_peak = peak(
+                factory.put(f'/api/recipes/{response.data["id"]}/image/',
+                            image, content_type='image/png'),
+                upload, pk=response.data['id'])
+            rows.append((
+                f'{len(image) / MEGABYTE:.1f} МБ',
+                f'JSON {json_peak:6.1f}   multipart {multipart_peak:6.1f}'
+                f'   PUT image {raw_peak:6.1f}'))
+        report('Пик памяти при загрузке, МБ:', rows)
+
+
+if __name__ == '__main__':
+    main()
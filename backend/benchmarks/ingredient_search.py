@@ -0,0 +1,43 @@
+"""Автодополнение ингредиентов: индекс в памяти против istartswith.
+
+    python -m benchmarks.ingredient_search [--ingredients 20000]
+"""
+from argparse import ArgumentParser
+
+from . import measure, report, setup, temporary_database
+
+QUERIES = ('м', 'мо', 'мол', 'молоко', 'соль', 'zzz')
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--ingredients', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=50)
+    options = parser.parse_args()
+    setup()
+    from api.ingredient_index import ingredient_index
+    from recipes.models import Ingredient
+
+    with temporary_database():
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=f'{prefix} {number}', measurement_unit='г')
+             for number in range(options.ingredients // 4)
+             for prefix in ('молоко', 'мука', 'соль', 'сахар')],
+            batch_size=1000)
+        ingredient_index.search('')
+        rows = []
+        for query in QUERIES:
+            orm = measure(lambda: list(
+                Ingredient.objects.filter(name__istartswith=query)
+                .values('id', 'name', 'measurement_unit')),
+                options.repeat)
+            index = measure(lambda: ingredient_index.search(query),
+                            options.repeat)
+            rows.append((repr(query),
+                         f'ORM {orm:8.3f} мс   индекс {index:8.3f} мс'))
+        report(f'Поиск по {Ingredient.objects.count()} ингредиентам, '
+               f'медиана из {options.repeat}:', rows)
+
+
+if __name__ == '__main__':
+    main()
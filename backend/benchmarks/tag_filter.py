@@ -0,0 +1,65 @@
+"""Фильтр "любой из тегов": join с TagRecipe против маски тегов.
+
+    python -m benchmarks.tag_filter [--recipes 100000]
+
+У каждого рецепта от одного до трех тегов из восьми. Замеряется
+то, что делает выдача списка: COUNT и первая страница по дате.
+"""
+from argparse import ArgumentParser
+
+from . import create_recipes, measure, report, setup, temporary_database
+
+TAGS = ('breakfast', 'lunch', 'dinner', 'dessert', 'soup', 'salad',
+        'drink', 'snack')
+LIMIT = 6
+
+
+def recipe_tags(number):
+    """Номера тегов рецепта number."""
+    return sorted({number % len(TAGS), number // 7 % len(TAGS),
+                   number // 49 % len(TAGS)})
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--recipes', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=10)
+    options = parser.parse_args()
+    setup()
+    from recipes.models import Recipe, Tag, TagRecipe, tag_mask
+    from users.models import User
+
+    with temporary_database():
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='x')
+        tags = [Tag.objects.create(name=slug, slug=slug, color=f'#00000{n}')
+                for n, slug in enumerate(TAGS)]
+        create_recipes(author, options.recipes, tag_mask=lambda number: (
+            tag_mask(tags[index].pk for index in recipe_tags(number))))
+        pks = Recipe.objects.order_by('-pub_date').values_list(
+            'pk', flat=True)
+        TagRecipe.objects.bulk_create(
+            [TagRecipe(recipe_id=pk, tag=tags[index])
+             for number, pk in enumerate(pks)
+             for index in recipe_tags(number)], batch_size=5000)
+        rows = []
+        for slugs in (TAGS[:1], TAGS[:3], TAGS[5:]):
+            join = Recipe.objects.filter(tags__slug__in=slugs).distinct()
+            mask = Recipe.objects.with_any_tag(
+                [tag.pk for tag in tags if tag.slug in slugs])
+            assert join.count() == mask.count()
+            timings = []
+            for queryset in (join, mask):
+                def get():
+                    queryset.count()
+                    list(queryset.order_by('-pub_date')[:LIMIT])
+                timings.append(measure(get, options.repeat))
+            rows.append((', '.join(slugs),
+                         f'join {timings[0]:8.2f} мс   '
+                         f'маска {timings[1]:8.2f} мс'))
+        report(f'COUNT и первая страница из {options.recipes} рецептов, '
+               f'медиана из {options.repeat}:', rows)
+
+
+if __name__ == '__main__':
+    main()
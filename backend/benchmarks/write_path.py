@@ -0,0 +1,73 @@
+"""Число SQL-запросов при создании и изменении рецепта.
+
+    python -m benchmarks.write_path
+
+Изменение оставляет половину ингредиентов с прежним количеством,
+у четверти меняет количество, а остальные заменяет новыми.
+"""
+from argparse import ArgumentParser
+from base64 import b64encode
+
+from . import (count_queries, png_bytes, report, setup, temporary_database,
+               without_image_processing)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1, 10, 50, 100])
+    options = parser.parse_args()
+    setup()
+    from rest_framework.test import APIClient
+
+    from recipes.models import Ingredient, Tag
+    from users.models import User
+
+    without_image_processing()
+    image = 'data:image/png;base64,' + b64encode(png_bytes()).decode()
+    with temporary_database():
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='x')
+        tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        ingredients = Ingredient.objects.bulk_create(
+            [Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+             for number in range(2 * max(options.sizes))])
+        client = APIClient()
+        client.force_authenticate(author)
+        rows = []
+        for size in options.sizes:
+            payload = {
+                'name': f'Рецепт {size}', 'text': 'Описание',
+                'cooking_time': 10, 'tags': [tag.pk], 'image': image,
+                'ingredients': [{'id': ingredient.pk, 'amount': 10}
+                                for ingredient in ingredients[:size]],
+            }
+            responses = []
+
+            def create():
+                responses.append(
+                    client.post('/api/recipes/', payload, format='json'))
+            created = count_queries(create)
+            assert responses[-1].status_code == 201, responses[-1].content
+            recipe_id = responses[-1].json()['id']
+            keep, change = size // 2, size // 4
+            payload['ingredients'] = (
+                payload['ingredients'][:keep]
+                + [{'id': ingredient.pk, 'amount': 20}
+                   for ingredient in ingredients[keep:keep + change]]
+                + [{'id': ingredient.pk, 'amount': 10}
+                   for ingredient in ingredients[
+                       size:2 * size - keep - change]])
+
+            def update():
+                responses.append(client.patch(
+                    f'/api/recipes/{recipe_id}/', payload, format='json'))
+            updated = count_queries(update)
+            assert responses[-1].status_code == 200, responses[-1].content
+            rows.append((f'{size} ингр.',
+                         f'создание {created:3}   изменение {updated:3}'))
+        report('SQL-запросов на запрос к API:', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+import os
+import shutil
+
+
+def on_starting(server):
+    """Метрики прошлого запуска не должны попасть в /metrics."""
+    metrics_dir = os.getenv('METRICS_DIR')
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
@@ -3,7 +3,7 @@ from django.contrib import admin
 from users.models import Subscribe, User
 
 from .models import (Basket, Favorite, Ingredient, IngredientRecipe, Recipe,
-                     Tag, TagRecipe)
+                     ShoppingListItem, Tag, TagRecipe)
 
 
 @admin.register(User)
@@ -117,3 +117,15 @@ class FavoriteAdmin(admin.ModelAdmin):
     )
     search_fields = ('user',)
     empty_value_display = "-пусто-"
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'user',
+        'ingredient',
+        'total_amount'
+    )
+    search_fields = ('user',)
+    empty_value_display = "-пусто-"
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def restore_search_index(sender, using, **kwargs):
+    """SQLite теряет триггеры поиска, когда пересоздает таблицу рецептов."""
+    from .search import ensure_search_index
+
+    ensure_search_index(connections[using])
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(restore_search_index, sender=self)
@@ -0,0 +1,60 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, local
+
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_executors_lock = Lock()
+_pending = local()
+
+
+def _run_in_worker(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой',
+                         func.__name__)
+    finally:
+        connections.close_all()
+
+
+def run_in_background(pool, workers, func, *args):
+    """Выполнить func(*args) в пуле потоков pool, не блокируя запрос.
+
+    При workers == 0 задача выполняется сразу в текущем потоке.
+    """
+    if not workers:
+        func(*args)
+        return
+    with _executors_lock:
+        executor = _executors.get(pool)
+        if executor is None:
+            executor = _executors[pool] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=pool)
+    executor.submit(_run_in_worker, func, args)
+
+
+def after_commit(func, items):
+    """Вызвать func(множество items) после фиксации транзакции.
+
+    Элементы всех вызовов с той же func до фиксации собираются вместе,
+    и func вызывается один раз: удаление сотни строк с сигналом на
+    каждую дает одну запись, а не сотню. После отката собранное
+    уходит со следующей фиксацией, так что func должна допускать
+    лишние элементы.
+    """
+    items = set(items)
+    if not items:
+        return
+    pending = _pending.__dict__.setdefault('items', {})
+    pending.setdefault(func, set()).update(items)
+
+    def flush():
+        collected = pending.pop(func, None)
+        if collected:
+            func(collected)
+
+    transaction.on_commit(flush)
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Subscribe, User
+
+from .background import run_in_background
+from .models import FeedEntry, Recipe
+
+
+def is_fanned_out(author_id):
+    """Раскладываются ли рецепты автора по лентам подписчиков."""
+    return User.objects.filter(
+        pk=author_id,
+        follower_count__lte=settings.FEED_MAX_FANOUT_FOLLOWERS).exists()
+
+
+def change_follower_count(author_id, delta):
+    """Изменить счетчик подписчиков автора, вернуть новое значение.
+
+    UPDATE блокирует строку автора до конца транзакции, поэтому каждая
+    подписка видит свое значение счетчика.
+    """
+    authors = User.objects.filter(pk=author_id)
+    authors.update(follower_count=F('follower_count') + delta)
+    return authors.values_list('follower_count', flat=True).first()
+
+
+def recount_followers():
+    """Пересчитать счетчики подписчиков всех пользователей."""
+    followers = Subscribe.objects.filter(
+        following=OuterRef('pk')
+    ).values('following').annotate(total=Count('pk')).values('total')
+    User.objects.update(follower_count=Coalesce(Subquery(followers), 0))
+
+
+def add_entries(pairs):
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, recipe_id=recipe_id)
+         for user_id, recipe_id in pairs],
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_recipe(recipe_id):
+    """Разложить новый рецепт по лентам подписчиков автора."""
+    author_id = (Recipe.objects.filter(pk=recipe_id)
+                 .values_list('author_id', flat=True).first())
+    if author_id is None or not is_fanned_out(author_id):
+        return
+    followers = Subscribe.objects.filter(
+        following_id=author_id).values_list('user_id', flat=True)
+    add_entries((user_id, recipe_id) for user_id in followers)
+
+
+def backfill_feed(user_id, author_id):
+    """Добавить в ленту нового подписчика последние рецепты автора."""
+    if not is_fanned_out(author_id):
+        return
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('pk', flat=True)[:settings.FEED_BACKFILL_RECIPES]
+    add_entries((user_id, recipe_id) for recipe_id in recipes)
+
+
+def clear_author(author_id):
+    """Убрать из лент рецепты автора, который больше не раскладывается."""
+    if not is_fanned_out(author_id):
+        FeedEntry.objects.filter(recipe__author_id=author_id).delete()
+
+
+def backfill_followers(author_id):
+    """Разложить рецепты автора, который снова раскладывается."""
+    followers = Subscribe.objects.filter(
+        following_id=author_id).values_list('user_id', flat=True)
+    for user_id in followers.iterator():
+        backfill_feed(user_id, author_id)
+
+
+def follower_added(user_id, author_id):
+    """Учесть новую подписку; вызывается в транзакции подписки."""
+    followers = change_follower_count(author_id, 1)
+    if followers == settings.FEED_MAX_FANOUT_FOLLOWERS + 1:
+        # Рецепты автора теперь читаются напрямую, записи лент лишние.
+        transaction.on_commit(lambda: run_in_background(
+            'feed-fanout', settings.FEED_WORKERS, clear_author, author_id))
+    else:
+        transaction.on_commit(lambda: schedule_backfill(user_id, author_id))
+
+
+def follower_removed(user_id, author_id):
+    """Учесть отписку; вызывается в транзакции отписки."""
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+    followers = change_follower_count(author_id, -1)
+    if followers == settings.FEED_MAX_FANOUT_FOLLOWERS:
+        # Автор снова раскладывается: ленты подписчиков заполняются.
+        transaction.on_commit(lambda: run_in_background(
+            'feed-fanout', settings.FEED_WORKERS,
+            backfill_followers, author_id))
+
+
+def schedule_fan_out(recipe_id):
+    run_in_background('feed-fanout', settings.FEED_WORKERS,
+                      fan_out_recipe, recipe_id)
+
+
+def schedule_backfill(user_id, author_id):
+    run_in_background('feed-fanout', settings.FEED_WORKERS,
+                      backfill_feed, user_id, author_id)
+
+
+def feed_recipes(queryset, user):
+    """Лента: разложенные рецепты и рецепты популярных авторов."""
+    return queryset.in_feed_of(user, settings.FEED_MAX_FANOUT_FOLLOWERS)
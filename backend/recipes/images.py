@@ -0,0 +1,108 @@
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .background import run_in_background
+
+logger = logging.getLogger(__name__)
+
+# Размер по большей стороне для каждого варианта изображения.
+VARIANT_SIZES = {
+    'card': 480,
+    'detail': 1200,
+    'original': 2048,
+}
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+# Варианты лежат в каталоге своего размера; ContentAddressedStorage
+# раскладывает их дальше по первым символам хеша (ab/cd/).
+VARIANTS_DIR = 'recipes/variants'
+
+
+def variants_ready(recipe):
+    return bool(recipe.image) and (
+        recipe.image_variants.get('source') == recipe.image.name)
+
+
+def variant_urls(recipe):
+    """Относительные URL готовых вариантов: {вариант: {формат: url}}."""
+    if not variants_ready(recipe):
+        return {}
+    return {
+        variant: {fmt: default_storage.url(name)
+                  for fmt, name in formats.items()}
+        for variant, formats in recipe.image_variants.items()
+        if variant in VARIANT_SIZES
+    }
+
+
+def delete_variants(variants):
+    for variant, formats in variants.items():
+        if variant in VARIANT_SIZES:
+            for name in formats.values():
+                default_storage.delete(name)
+
+
+def render_variants(source):
+    """Сохранить варианты файла source, вернуть их имена в хранилище."""
+    with default_storage.open(source) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    opaque = image
+    if image.mode == 'RGBA':
+        opaque = Image.new('RGB', image.size, 'white')
+        opaque.paste(image, mask=image.getchannel('A'))
+    stem = os.path.splitext(os.path.basename(source))[0]
+    variants = {'source': source}
+    for variant, size in VARIANT_SIZES.items():
+        variants[variant] = {}
+        for fmt, (pil_format, options) in VARIANT_FORMATS.items():
+            resized = (image if fmt == 'webp' else opaque).copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            buffer = BytesIO()
+            # Метаданные (EXIF, ICC) не передаются и не сохраняются.
+            resized.save(buffer, pil_format, **options)
+            name = f'{VARIANTS_DIR}/{variant}/{stem}.{fmt}'
+            variants[variant][fmt] = default_storage.save(
+                name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def generate_variants(recipe_id, force=False):
+    """Создать варианты изображения рецепта; False - если не удалось."""
+    from .models import Recipe
+
+    try:
+        recipe = Recipe.objects.get(pk=recipe_id)
+        if not recipe.image or (variants_ready(recipe) and not force):
+            return True
+        source = recipe.image.name
+        variants = render_variants(source)
+        recipe.refresh_from_db(fields=['image', 'image_variants'])
+        if recipe.image.name != source:
+            delete_variants(variants)
+            return True
+        old_variants = recipe.image_variants
+        recipe.image_variants = variants
+        recipe.save(update_fields=['image_variants'])
+        delete_variants(old_variants)
+        return True
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+        return False
+
+
+def schedule_variants(recipe_id):
+    """Поставить обработку изображения в пул, не блокируя запрос."""
+    run_in_background('image-variants', settings.IMAGE_VARIANT_WORKERS,
+                      generate_variants, recipe_id)
@@ -0,0 +1,155 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from recipes.images import VARIANT_SIZES
+from recipes.models import MediaFile, PendingMediaDeletion, Recipe
+from recipes.storage import ContentAddressedStorage
+
+BATCH_SIZE = 1000
+
+
+def walk(storage, path):
+    """Пути всех файлов каталога хранилища, без загрузки списка целиком."""
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from walk(storage, posixpath.join(path, directory))
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def image_references(names):
+    """Сколько рецептов ссылается на каждый из файлов names."""
+    return dict(Recipe.objects.filter(image__in=names)
+                .values_list('image')
+                .annotate(references=Count('pk'))
+                .order_by())
+
+
+def reconcile(names, variants):
+    """Привести счетчики ссылок файлов к числу ссылок из рецептов.
+
+    Ссылки из изображений пересчитываются под блокировкой строк
+    MediaFile, чтобы не потерять параллельную загрузку того же файла.
+    """
+    names = [name for name in names
+             if ContentAddressedStorage.is_content_addressed(name)]
+    with transaction.atomic():
+        stored = {media_file.name: media_file
+                  for media_file in MediaFile.objects.select_for_update()
+                  .filter(name__in=names)}
+        images = image_references(names)
+        changed, missing = [], []
+        for name in names:
+            references = images.get(name, 0) + variants[name]
+            media_file = stored.get(name)
+            if not references:
+                continue
+            if media_file is None:
+                missing.append(MediaFile(name=name, ref_count=references))
+            elif media_file.ref_count != references:
+                media_file.ref_count = references
+                changed.append(media_file)
+        MediaFile.objects.bulk_update(changed, ['ref_count'])
+        MediaFile.objects.bulk_create(missing, ignore_conflicts=True)
+
+
+class Command(BaseCommand):
+    help = ('Удалить медиафайлы, на которые не ссылаются рецепты: '
+            'из очереди удаления или полным обходом хранилища.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scan', action='store_true',
+            help='Обойти каталог хранилища вместо обработки очереди.')
+        parser.add_argument(
+            '--path', default='recipes',
+            help='Каталог хранилища для обхода (по умолчанию recipes).')
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Не трогать файлы моложе указанного числа часов.')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько файлов сверять с базой за один запрос.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать файлы, ничего не удаляя.')
+
+    def handle(self, *args, **options):
+        deadline = timezone.now() - timedelta(hours=options['grace_hours'])
+        if options['scan']:
+            count = self.scan(deadline, options)
+        else:
+            count = self.process_queue(deadline, options)
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(f'{action} файлов - {count}.')
+
+    def process_queue(self, deadline, options):
+        """Освободить файлы, поставленные в очередь раньше deadline."""
+        count = 0
+        pending = PendingMediaDeletion.objects.filter(queued_at__lt=deadline)
+        for batch in batches(pending.iterator(), options['batch_size']):
+            for item in batch:
+                if options['dry_run']:
+                    self.stdout.write(item.name)
+                else:
+                    default_storage.delete(item.name)
+                count += 1
+            if not options['dry_run']:
+                PendingMediaDeletion.objects.filter(
+                    pk__in=[item.pk for item in batch]).delete()
+        return count
+
+    def scan(self, deadline, options):
+        """Удалить файлы без ссылок из рецептов, старше deadline.
+
+        У остальных файлов старше deadline счетчик ссылок MediaFile
+        сверяется с рецептами: он расходится, если запись рецепта не
+        удалась после сохранения файла.
+        """
+        variants = Counter(
+            name
+            for image_variants in Recipe.objects.values_list(
+                'image_variants', flat=True).iterator()
+            for variant, formats in image_variants.items()
+            if variant in VARIANT_SIZES
+            for name in formats.values()
+        )
+        purge = getattr(default_storage, 'purge', default_storage.delete)
+        count = 0
+        names = walk(default_storage, options['path'])
+        for batch in batches(names, options['batch_size']):
+            batch = [name for name in batch
+                     if default_storage.get_modified_time(name) < deadline]
+            images = image_references(batch)
+            referenced = [name for name in batch
+                          if images.get(name) or variants[name]]
+            if (isinstance(default_storage, ContentAddressedStorage)
+                    and not options['dry_run']):
+                reconcile(referenced, variants)
+            for name in batch:
+                if images.get(name) or variants[name]:
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    purge(name)
+                count += 1
+        return count
@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from recipes.scores import decay_scores, rebuild_scores
+
+
+class Command(BaseCommand):
+    help = ('Сдвинуть отсчет популярности рецептов (запускать '
+            'периодически) или пересчитать ее заново (--rebuild).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересчитать популярность по избранному и корзинам, '
+                 'например после изменения периодов полураспада.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            count = rebuild_scores()
+            self.stdout.write(f'Популярность пересчитана, рецептов - {count}.')
+        else:
+            count = decay_scores()
+            self.stdout.write(f'Отсчет сдвинут, рецептов - {count}.')
@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создать варианты изображений для существующих рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать варианты, даже если они уже есть.')
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        recipe_ids = (Recipe.objects.exclude(image='')
+                      .values_list('pk', flat=True).iterator())
+        for recipe_id in recipe_ids:
+            if generate_variants(recipe_id, force=options['force']):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(
+            f'Обработано рецептов - {done}, с ошибками - {failed}.')
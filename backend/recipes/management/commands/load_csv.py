@@ -1,27 +1,95 @@
 import csv
-
-from django.core.management import BaseCommand
+import json
 import os
 
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from api.ingredient_index import ingredient_index
 from Foodgram.settings import BASE_DIR
 from recipes.models import Ingredient
 
+BATCH_SIZE = 1000
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.DictReader(file, delimiter=','):
+        yield row['name'], row['measurement_unit']
+
+
+def read_json(file):
+    """Построчно разобрать JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            row, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON.')
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield row['name'], row['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
 
 class Command(BaseCommand):
+    help = 'Загрузить ингредиенты из CSV или JSON файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(BASE_DIR, 'data/ingredients.csv'),
+            help='Путь к файлу .csv или .json.')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество записей в одном INSERT.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать новые записи, ничего не сохраняя.')
 
     def handle(self, *args, **options):
-        path = os.path.join(BASE_DIR, 'data/ingredients.csv')
-        with open(path,
-                  encoding='utf-8') as csv_file:
-            csv_reader = csv.DictReader(csv_file, delimiter=',')
-            count = 0
-            for row in csv_reader:
-                check_empty = Ingredient.objects.filter(
-                    name=row['name'],
-                    measurement_unit=row['measurement_unit']).exists()
-                if not check_empty:
-                    Ingredient.objects.create(
-                        name=row['name'],
-                        measurement_unit=row['measurement_unit'])
-                    count += 1
-            print(f'Загрузка завершена! Добавлено записей - {count}.')
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        seen = set(Ingredient.objects.values_list('name',
+                                                  'measurement_unit'))
+        count = 0
+        batch = []
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            for name, measurement_unit in reader(file):
+                key = (name.strip(), measurement_unit.strip())
+                if key in seen:
+                    continue
+                seen.add(key)
+                count += 1
+                if options['dry_run']:
+                    continue
+                batch.append(Ingredient(name=key[0],
+                                        measurement_unit=key[1]))
+                if len(batch) >= options['batch_size']:
+                    Ingredient.objects.bulk_create(
+                        batch, ignore_conflicts=True)
+                    batch = []
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        if options['dry_run']:
+            self.stdout.write(f'Будет добавлено записей - {count}.')
+            return
+        if count:
+            ingredient_index.invalidate()
+        self.stdout.write(f'Загрузка завершена! Добавлено записей - {count}.')
@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.feed import backfill_feed, recount_followers
+from recipes.models import FeedEntry
+from users.models import Subscribe
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать подписчиков и пересобрать ленты подписок, '
+            'например после изменения FEED_MAX_FANOUT_FOLLOWERS.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recount_followers()
+            FeedEntry.objects.all().delete()
+            for user_id, author_id in Subscribe.objects.values_list(
+                    'user_id', 'following_id').iterator():
+                backfill_feed(user_id, author_id)
+        self.stdout.write(
+            f'Ленты пересобраны, записей - {FeedEntry.objects.count()}.')
@@ -0,0 +1,53 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import IngredientRecipe, ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Сверить сводные списки покупок с корзинами '
+            'и пересобрать их.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить, завершиться с ошибкой при расхождениях.')
+
+    def handle(self, *args, **options):
+        expected = {
+            (row['recipe__baskets__user'], row['ingredient']):
+                row['total_amount']
+            for row in IngredientRecipe.objects
+            .filter(recipe__baskets__isnull=False)
+            .values('recipe__baskets__user', 'ingredient')
+            .annotate(total_amount=Sum('amount'))
+            .iterator()
+        }
+        actual = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListItem.objects
+            .values_list('user_id', 'ingredient_id', 'total_amount')
+            .iterator()
+        }
+        drift = [key for key in expected.keys() | actual.keys()
+                 if expected.get(key) != actual.get(key)]
+        self.stdout.write(f'Расхождений в списках покупок: {len(drift)}.')
+        if options['check']:
+            if drift:
+                raise CommandError('Списки покупок расходятся с корзинами.')
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                (ShoppingListItem(user_id=user_id,
+                                  ingredient_id=ingredient_id,
+                                  total_amount=total_amount)
+                 for (user_id, ingredient_id), total_amount
+                 in expected.items()),
+                batch_size=BATCH_SIZE)
+        self.stdout.write(
+            f'Списки покупок пересобраны, позиций - {len(expected)}.')
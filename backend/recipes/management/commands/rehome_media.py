@@ -0,0 +1,52 @@
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+
+from recipes.images import VARIANT_SIZES
+from recipes.models import Recipe
+from recipes.storage import ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    help = ('Перенести изображения рецептов в хранилище '
+            'с адресацией по содержимому.')
+
+    def rehome(self, name):
+        if ContentAddressedStorage.is_content_addressed(name):
+            return name
+        with default_storage.open(name) as file:
+            new_name = default_storage.save(name, file)
+        default_storage.delete(name)
+        return new_name
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError(
+                'Хранилище по умолчанию не ContentAddressedStorage.')
+        moved = missing = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'pk', 'image', 'image_variants').iterator()
+        for recipe in recipes:
+            old_name = recipe.image.name
+            if ContentAddressedStorage.is_content_addressed(old_name):
+                continue
+            if not default_storage.exists(old_name):
+                missing += 1
+                self.stderr.write(f'Файл не найден: {old_name}')
+                continue
+            variants = recipe.image_variants
+            if variants.get('source') == old_name:
+                variants = {
+                    variant: (
+                        {fmt: self.rehome(name)
+                         for fmt, name in formats.items()}
+                        if variant in VARIANT_SIZES else formats)
+                    for variant, formats in variants.items()
+                }
+            recipe.image.name = self.rehome(old_name)
+            if variants.get('source') == old_name:
+                variants['source'] = recipe.image.name
+            recipe.image_variants = variants
+            recipe.save(update_fields=['image', 'image_variants'])
+            moved += 1
+        self.stdout.write(
+            f'Перенесено изображений - {moved}, не найдено - {missing}.')
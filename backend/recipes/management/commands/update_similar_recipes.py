@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand
+
+from recipes.models import PendingSimilarityUpdate
+from recipes.similarity import update_similar_recipes
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать похожие рецепты: для рецептов, измененных с '
+            'прошлого запуска, или для всех (--full).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать все рецепты, а не только измененные.')
+
+    def handle(self, *args, **options):
+        # Изменения, поставленные в очередь во время пересчета,
+        # останутся до следующего запуска.
+        pending = PendingSimilarityUpdate.objects.filter(
+            pk__lte=PendingSimilarityUpdate.objects.order_by(
+                '-pk').values_list('pk', flat=True).first() or 0)
+        if options['full']:
+            count = update_similar_recipes()
+        else:
+            recipe_ids = set(pending.values_list('recipe_id', flat=True))
+            count = update_similar_recipes(recipe_ids) if recipe_ids else 0
+        pending.delete()
+        self.stdout.write(f'Пересчитано рецептов - {count}.')
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:48
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def repoint(model, owner_field, keep_id, duplicate_ids):
+    taken = set(model.objects.filter(ingredient_id=keep_id)
+                .values_list(owner_field, flat=True))
+    for row in model.objects.filter(ingredient_id__in=duplicate_ids):
+        owner = getattr(row, f'{owner_field}_id')
+        if owner in taken:
+            row.delete()
+            continue
+        row.ingredient_id = keep_id
+        row.save(update_fields=['ingredient'])
+        taken.add(owner)
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Слить дубликаты перед добавлением ограничения уникальности.
+
+    Если рецепт содержал несколько дубликатов, остается одна строка;
+    после этого стоит выполнить rebuild_shopping_lists.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = (Ingredient.objects
+              .values('name', 'measurement_unit')
+              .annotate(keep_id=Min('id'), total=Count('id'))
+              .filter(total__gt=1))
+    for group in groups:
+        duplicate_ids = list(
+            Ingredient.objects
+            .filter(name=group['name'],
+                    measurement_unit=group['measurement_unit'])
+            .exclude(pk=group['keep_id'])
+            .values_list('pk', flat=True))
+        repoint(IngredientRecipe, 'recipe', group['keep_id'], duplicate_ids)
+        repoint(ShoppingListItem, 'user', group['keep_id'], duplicate_ids)
+        Ingredient.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:52
+
+from hashlib import sha256
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def content_hash(name, text, cooking_time):
+    # Копия recipes.models.recipe_content_hash на момент миграции.
+    normalized = '\n'.join(
+        ' '.join(str(value).split()).casefold()
+        for value in (name, text, cooking_time))
+    return sha256(normalized.encode()).hexdigest()
+
+
+def fill_content_hash(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    batch = []
+    for recipe in Recipe.objects.only(
+            'name', 'text', 'cooking_time').iterator(chunk_size=BATCH_SIZE):
+        recipe.content_hash = content_hash(
+            recipe.name, recipe.text, recipe.cooking_time)
+        batch.append(recipe)
+        if len(batch) >= BATCH_SIZE:
+            Recipe.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    Recipe.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_ingredient_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='content_hash',
+            field=models.CharField(default='', editable=False, max_length=64, verbose_name='Отпечаток содержимого'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recipe',
+            name='content_hash',
+            field=models.CharField(db_index=True, editable=False, max_length=64, verbose_name='Отпечаток содержимого'),
+        ),
+    ]
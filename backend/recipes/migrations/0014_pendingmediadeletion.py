@@ -0,0 +1,25 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_mediafile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingMediaDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Путь к файлу')),
+                ('queued_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Поставлен в очередь')),
+            ],
+            options={
+                'verbose_name': 'Файл к удалению',
+                'verbose_name_plural': 'Файлы к удалению',
+            },
+        ),
+    ]
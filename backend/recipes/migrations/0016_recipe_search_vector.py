@@ -0,0 +1,111 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.db import migrations
+
+# SQL скопирован из recipes.search на момент миграции: последующие
+# изменения модуля не должны менять то, что делает эта миграция.
+# После каждого migrate recipes.search.ensure_search_index ставит
+# триггеры заново, если они пропали.
+POSTGRESQL_INSTALL = [
+    """
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian',
+                                  coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('russian',
+                                     coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe',
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update()
+    """,
+    'UPDATE recipes_recipe SET name = name',
+    """
+    CREATE INDEX IF NOT EXISTS recipe_search_vector_idx
+    ON recipes_recipe USING gin (search_vector)
+    """,
+]
+POSTGRESQL_REMOVE = [
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()',
+]
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild')",
+]
+SQLITE_REMOVE = [
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+]
+
+STATEMENTS = {
+    'postgresql': (POSTGRESQL_INSTALL, POSTGRESQL_REMOVE),
+    'sqlite': (SQLITE_INSTALL, SQLITE_REMOVE),
+}
+
+
+def install_search_index(apps, schema_editor):
+    for statement in STATEMENTS.get(schema_editor.connection.vendor,
+                                    ((), ()))[0]:
+        schema_editor.execute(statement, params=None)
+
+
+def remove_search_index(apps, schema_editor):
+    for statement in STATEMENTS.get(schema_editor.connection.vendor,
+                                    ((), ()))[1]:
+        schema_editor.execute(statement, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(install_search_index, remove_search_index),
+    ]
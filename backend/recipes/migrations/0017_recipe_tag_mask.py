@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+TAG_MASK_BITS = 63
+BATCH_SIZE = 1000
+
+
+def fill_tag_masks(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TagRecipe = apps.get_model('recipes', 'TagRecipe')
+    masks = {}
+    rows = TagRecipe.objects.filter(
+        tag_id__lte=TAG_MASK_BITS
+    ).values_list('recipe_id', 'tag_id')
+    for recipe_id, tag_id in rows.iterator(chunk_size=BATCH_SIZE):
+        masks[recipe_id] = masks.get(recipe_id, 0) | 1 << (tag_id - 1)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, tag_mask=mask) for pk, mask in masks.items()],
+        ['tag_mask'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_tag_masks, migrations.RunPython.noop),
+    ]
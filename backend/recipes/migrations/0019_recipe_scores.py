@@ -0,0 +1,102 @@
+from django.db import migrations, models
+from django.db.models import Count
+import django.utils.timezone
+
+FAVORITE_WEIGHT = 1.0
+BASKET_WEIGHT = 1.0
+BATCH_SIZE = 1000
+
+# Поисковый вектор пересчитывается только при изменении названия и
+# описания, а не при каждом обновлении счетчиков популярности.
+POSTGRESQL_TRIGGER = """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE {columns}ON recipes_recipe
+    FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update()
+"""
+POSTGRESQL_DROP_TRIGGER = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe')
+
+
+def narrow_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_DROP_TRIGGER)
+        schema_editor.execute(
+            POSTGRESQL_TRIGGER.format(columns='OF name, text '))
+
+
+def widen_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_DROP_TRIGGER)
+        schema_editor.execute(POSTGRESQL_TRIGGER.format(columns=''))
+
+
+def fill_scores(apps, schema_editor):
+    """Существующие добавления считаются сделанными в момент отсчета."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ScoreEpoch = apps.get_model('recipes', 'ScoreEpoch')
+    ScoreEpoch.objects.create(pk=1, moment=django.utils.timezone.now())
+    scores = {}
+    for relation, weight in (('favorites', FAVORITE_WEIGHT),
+                             ('baskets', BASKET_WEIGHT)):
+        for pk, count in Recipe.objects.annotate(
+                count=Count(relation)).filter(count__gt=0).values_list(
+                    'pk', 'count').iterator(chunk_size=BATCH_SIZE):
+            scores[pk] = scores.get(pk, 0) + weight * count
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, popular_score=score, trending_score=score)
+         for pk, score in scores.items()],
+        ['popular_score', 'trending_score'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_similar_recipes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('moment', models.DateTimeField(verbose_name='Момент')),
+            ],
+            options={
+                'verbose_name': 'Отсчет популярности',
+                'verbose_name_plural': 'Отсчет популярности',
+            },
+        ),
+        migrations.AddField(
+            model_name='basket',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Добавлен'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Добавлен'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popular_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность за последние дни'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popular_score', '-id'], name='recipe_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-id'], name='recipe_trending_idx'),
+        ),
+        migrations.RunPython(narrow_search_trigger, widen_search_trigger),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
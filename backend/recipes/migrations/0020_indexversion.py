@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Индекс')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия индекса',
+                'verbose_name_plural': 'Версии индексов',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_indexversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.CharField(max_length=50, verbose_name='Индекс')),
+                ('version', models.PositiveBigIntegerField(verbose_name='Версия')),
+                ('recipe_ids', models.JSONField(verbose_name='Рецепты')),
+            ],
+            options={
+                'verbose_name': 'Изменение индекса',
+                'verbose_name_plural': 'Изменения индексов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='indexchange',
+            constraint=models.UniqueConstraint(fields=('index', 'version'), name='unique_index_change'),
+        ),
+    ]
@@ -1,9 +1,15 @@
+from hashlib import sha256
+
 from colorfield.fields import ColorField
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from django.db.models import PositiveSmallIntegerField
+from django.db import models, transaction
+from django.db.models import (Case, Exists, F, FloatField, OuterRef,
+                              PositiveSmallIntegerField, Sum, Value, When)
+from django.utils import timezone
 
-from users.models import User
+from users.models import Subscribe, User
 
 MIN_VALUE_COOKING_TIME = 1,
 MAX_VALUE_COOKING_TIME = 300,
@@ -71,11 +77,172 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient')
+        ]
 
     def __str__(self):
         return self.name
 
 
+def recipe_content_hash(name, text, cooking_time):
+    """Отпечаток содержимого рецепта для поиска дубликатов."""
+    normalized = '\n'.join(
+        ' '.join(str(value).split()).casefold()
+        for value in (name, text, cooking_time))
+    return sha256(normalized.encode()).hexdigest()
+
+
+# Теги рецепта дублируются битовой маской: тегу с id N соответствует
+# бит N - 1. Теги с id больше TAG_MASK_BITS в маску не попадают.
+TAG_MASK_BITS = 63
+
+
+def tag_mask(tag_ids):
+    """Маска набора тегов; None, если тег не помещается в маску."""
+    mask = 0
+    for tag_id in tag_ids:
+        if not 1 <= tag_id <= TAG_MASK_BITS:
+            return None
+        mask |= 1 << (tag_id - 1)
+    return mask
+
+
+# Вклад добавления в избранное и в корзину в популярность рецепта.
+FAVORITE_WEIGHT = 1.0
+BASKET_WEIGHT = 1.0
+
+
+def score_half_lives():
+    """Поля популярности рецепта и периоды полураспада их вкладов."""
+    return {
+        'popular_score': settings.RECIPE_POPULAR_HALF_LIFE,
+        'trending_score': settings.RECIPE_TRENDING_HALF_LIFE,
+    }
+
+
+def time_weight(elapsed, half_life):
+    """Вес события через elapsed после отсчета (ScoreEpoch).
+
+    Вместо того чтобы уменьшать старые вклады, новые увеличиваются:
+    порядок рецептов от этого не меняется, а счетчик можно обновлять
+    прибавлением.
+    """
+    return 2 ** (elapsed / half_life)
+
+
+# Через сколько периодов полураспада после отсчета record_activity
+# ставит сдвиг отсчета в фон: веса остаются около 2 ** 30, новые вклады
+# не поглощают старые в точности float, а 2 ** x не переполняется.
+MAX_EPOCH_HALF_LIVES = 30
+
+
+def epoch_is_stale(epoch, moment):
+    return moment - epoch > MAX_EPOCH_HALF_LIVES * min(
+        score_half_lives().values())
+
+
+# Поля рецепта, которые меняет автор. Остальные столбцы (счетчики,
+# маска тегов, варианты изображения) обновляются другими путями
+# параллельно и при изменении рецепта не перезаписываются.
+RECIPE_EDITABLE_FIELDS = ('name', 'image', 'text', 'cooking_time')
+
+# Связанные данные, нужные для полного представления рецепта.
+RECIPE_RELATED_LOOKUPS = ('tags', 'recipes__ingredient')
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для чтения через API."""
+
+    def with_user_flags(self, user):
+        """Аннотации is_favorited, is_in_shopping_cart и is_subscribed."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_subscribed=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(Basket.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_subscribed=Exists(Subscribe.objects.filter(
+                user=user, following=OuterRef('author'))),
+        )
+
+    def with_any_tag(self, tag_ids):
+        """Рецепты хотя бы с одним из тегов, без join с TagRecipe."""
+        mask = tag_mask(tag_ids)
+        if mask is None:
+            return self.filter(tags__in=tag_ids).distinct()
+        return self.alias(
+            tag_match=F('tag_mask').bitand(mask)).filter(tag_match__gt=0)
+
+    def update_tag_masks(self):
+        """Пересчитать маски тегов рецептов выборки, вернуть их."""
+        masks = dict.fromkeys(self.values_list('pk', flat=True), 0)
+        rows = TagRecipe.objects.filter(
+            recipe_id__in=masks, tag_id__lte=TAG_MASK_BITS
+        ).values_list('recipe_id', 'tag_id')
+        for recipe_id, tag_id in rows:
+            masks[recipe_id] |= 1 << (tag_id - 1)
+        self.model.objects.bulk_update(
+            [self.model(pk=pk, tag_mask=mask) for pk, mask in masks.items()],
+            ['tag_mask'], batch_size=1000)
+        return masks
+
+    def record_activity(self, weight, moment):
+        """Учесть в популярности событие moment; weight < 0 - отмена."""
+        epoch = ScoreEpoch.current()
+        if epoch_is_stale(epoch, moment):
+            from .scores import schedule_decay
+
+            schedule_decay()
+        return self.update(**{
+            field: F(field) + weight * time_weight(moment - epoch, half_life)
+            for field, half_life in score_half_lives().items()})
+
+    def record_activities(self, weight, moments):
+        """record_activity одним запросом для событий {рецепт: момент}."""
+        if not moments:
+            return 0
+        epoch = ScoreEpoch.current()
+        if epoch_is_stale(epoch, max(moments.values())):
+            from .scores import schedule_decay
+
+            schedule_decay()
+        return self.filter(pk__in=moments).update(**{
+            field: F(field) + Case(
+                *[When(pk=pk, then=Value(
+                    weight * time_weight(moment - epoch, half_life)))
+                  for pk, moment in moments.items()],
+                output_field=FloatField())
+            for field, half_life in score_half_lives().items()})
+
+    def in_feed_of(self, user, max_fanout_followers):
+        """Рецепты авторов, на которых подписан пользователь.
+
+        Рецепты большинства авторов заранее разложены по лентам
+        подписчиков (FeedEntry). Авторы, у которых подписчиков больше
+        max_fanout_followers, в ленты не раскладываются - их рецепты
+        выбираются при чтении по счетчику подписчиков автора.
+
+        Id рецептов собираются UNION двух выборок, каждую из которых
+        обслуживает свой индекс (FeedEntry по пользователю, Recipe по
+        автору): OR двух подзапросов IN индексом не обслуживается, и
+        редкая лента читала бы всю таблицу рецептов.
+        """
+        pulled_authors = Subscribe.objects.filter(
+            user=user, following__follower_count__gt=max_fanout_followers
+        ).values('following')
+        fanned_out = FeedEntry.objects.filter(user=user).values('recipe')
+        pulled = Recipe.objects.filter(
+            author__in=pulled_authors).values('pk')
+        return self.filter(pk__in=fanned_out.union(pulled))
+
+
 class Recipe(models.Model):
     """Модель рецептов"""
     name = models.CharField(
@@ -87,6 +254,12 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         upload_to='recipes/image/',
     )
+    image_variants = models.JSONField(
+        verbose_name='Варианты изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
         help_text='Введите описание рецепта',
@@ -104,6 +277,35 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    content_hash = models.CharField(
+        verbose_name='Отпечаток содержимого',
+        max_length=64,
+        db_index=True,
+        editable=False,
+    )
+    # Счетчики избранного и корзин с затуханием (см. recipes.scores).
+    popular_score = models.FloatField(
+        verbose_name='Популярность',
+        default=0,
+        editable=False,
+    )
+    trending_score = models.FloatField(
+        verbose_name='Популярность за последние дни',
+        default=0,
+        editable=False,
+    )
+    # Поддерживается сигналами m2m_changed и TagRecipe.
+    tag_mask = models.BigIntegerField(
+        verbose_name='Маска тегов',
+        default=0,
+        editable=False,
+    )
+    # Заполняется триггером базы данных (см. recipes.search).
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -129,6 +331,21 @@ class Recipe(models.Model):
         verbose_name='Ингредиент рецепта'
     )
 
+    objects = RecipeQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self.content_hash = recipe_content_hash(
+            self.name, self.text, self.cooking_time)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'content_hash'}
+        super().save(*args, **kwargs)
+
+    def get_amounts(self):
+        """Количество каждого ингредиента: {ingredient_id: amount}."""
+        return dict(IngredientRecipe.objects.filter(recipe=self)
+                    .values_list('ingredient_id', 'amount'))
+
     def trim50(self):
         return u"%s..." % (self.name[:50],)
     trim50.short_description = 'Название рецепта'
@@ -136,6 +353,14 @@ class Recipe(models.Model):
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['-popular_score', '-id'],
+                         name='recipe_popular_idx'),
+            models.Index(fields=['-trending_score', '-id'],
+                         name='recipe_trending_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -203,6 +428,71 @@ class IngredientRecipe(models.Model):
                 f'{self.ingredient.measurement_unit}')
 
 
+def lock_users(user_ids):
+    """Заблокировать строки пользователей до конца транзакции.
+
+    Блокировка упорядочивает параллельные изменения корзины и списка
+    покупок одного пользователя.
+    """
+    list(User.objects.select_for_update()
+         .filter(pk__in=user_ids).order_by('pk')
+         .values_list('pk', flat=True))
+
+
+def summed_amounts(recipe_ids):
+    """Количество ингредиентов {ingredient_id: сумма} по рецептам."""
+    return dict(
+        IngredientRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .values('ingredient_id').annotate(total=Sum('amount'))
+        .values_list('ingredient_id', 'total'))
+
+
+class BasketQuerySet(models.QuerySet):
+    """Корзина меняется вместе со сводным списком покупок."""
+
+    def add_recipes(self, user, recipe_ids):
+        """Положить рецепты в корзину; вернуть id добавленных."""
+        with transaction.atomic():
+            lock_users([user.pk])
+            present = set(self.filter(user=user, recipe_id__in=recipe_ids)
+                          .values_list('recipe_id', flat=True))
+            added = [pk for pk in dict.fromkeys(recipe_ids)
+                     if pk not in present]
+            baskets = self.bulk_create([Basket(user=user, recipe_id=pk)
+                                        for pk in added])
+            Recipe.objects.record_activities(
+                BASKET_WEIGHT,
+                {basket.recipe_id: basket.added_at for basket in baskets})
+            ShoppingListItem.objects.change_amounts(
+                [user.pk], summed_amounts(added))
+        return added
+
+    def remove_recipes(self, user, recipe_ids=None):
+        """Убрать рецепты из корзины (все при recipe_ids=None).
+
+        Возвращает количество удаленных рецептов.
+        """
+        with transaction.atomic():
+            lock_users([user.pk])
+            rows = self.filter(user=user)
+            if recipe_ids is not None:
+                rows = rows.filter(recipe_id__in=recipe_ids)
+            removed = dict(rows.values_list('recipe_id', 'added_at'))
+            # Популярность и список покупок меняются здесь же, одним
+            # запросом на все рецепты, поэтому строки удаляются без
+            # сигналов post_delete (и без их выборки по одной).
+            deleted = rows._raw_delete(rows.db)
+            Recipe.objects.record_activities(-BASKET_WEIGHT, removed)
+            if recipe_ids is None:
+                ShoppingListItem.objects.filter(user=user).delete()
+            else:
+                ShoppingListItem.objects.change_amounts(
+                    [user.pk],
+                    {pk: -amount
+                     for pk, amount in summed_amounts(removed).items()})
+        return deleted
+
+
 class Basket(models.Model):
     """Модель корзины"""
     user = models.ForeignKey(
@@ -219,6 +509,12 @@ class Basket(models.Model):
         verbose_name='Рецепты',
         help_text='Выберите рецепт'
     )
+    added_at = models.DateTimeField(
+        'Добавлен',
+        auto_now_add=True
+    )
+
+    objects = BasketQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Корзина'
@@ -248,6 +544,10 @@ class Favorite(models.Model):
         verbose_name='Рецепт',
         help_text='Укажите рецепт'
     )
+    added_at = models.DateTimeField(
+        'Добавлен',
+        auto_now_add=True
+    )
 
     class Meta:
         verbose_name = 'Избранный'
@@ -259,3 +559,249 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.recipe} {self.user}'
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    """Изменение сводного списка покупок вместе с корзиной."""
+
+    def change_amounts(self, user_ids, amounts):
+        """Прибавить amounts {ingredient_id: количество} пользователям.
+
+        Количество может быть отрицательным; строки, в которых итог
+        стал нулевым, удаляются.
+        """
+        amounts = {pk: amount for pk, amount in amounts.items() if amount}
+        user_ids = sorted(set(user_ids))
+        if not amounts or not user_ids:
+            return
+        with transaction.atomic():
+            lock_users(user_ids)
+            rows = self.filter(user_id__in=user_ids,
+                               ingredient_id__in=amounts)
+            existing = set(rows.values_list('user_id', 'ingredient_id'))
+            if existing:
+                rows.update(total_amount=F('total_amount') + Case(
+                    *[When(ingredient_id=pk, then=Value(amount))
+                      for pk, amount in amounts.items()],
+                    output_field=models.IntegerField()))
+            self.bulk_create([
+                ShoppingListItem(user_id=user_id, ingredient_id=pk,
+                                 total_amount=amount)
+                for user_id in user_ids
+                for pk, amount in amounts.items()
+                if amount > 0 and (user_id, pk) not in existing
+            ])
+            self.filter(user_id__in=user_ids,
+                        total_amount__lte=0).delete()
+
+
+class ShoppingListItem(models.Model):
+    """Сводный список покупок пользователя по рецептам в корзине."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.IntegerField('Количество')
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_list_item')
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient}: {self.total_amount}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика, разложенный при публикации."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_feed_entry')
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.recipe}'
+
+
+class MediaFile(models.Model):
+    """Счетчик ссылок на файл в ContentAddressedStorage."""
+    name = models.CharField(
+        'Путь к файлу',
+        max_length=255,
+        unique=True
+    )
+    ref_count = models.PositiveIntegerField('Количество ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self):
+        return f'{self.name} ({self.ref_count})'
+
+
+class PendingMediaDeletion(models.Model):
+    """Файл, на который больше не ссылается рецепт, ждет удаления."""
+    name = models.CharField('Путь к файлу', max_length=255)
+    queued_at = models.DateTimeField(
+        'Поставлен в очередь',
+        auto_now_add=True,
+        db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Файл к удалению'
+        verbose_name_plural = 'Файлы к удалению'
+
+    def __str__(self):
+        return self.name
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт по доле общих ингредиентов (коэффициент Жаккара).
+
+    Заполняется командой update_similar_recipes.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+        # Поиск по рецепту идет по индексу (recipe, -score).
+        db_index=False
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = [
+            models.Index(fields=['recipe', '-score'],
+                         name='similar_recipe_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} {self.similar}'
+
+
+class PendingSimilarityUpdate(models.Model):
+    """Рецепт, для которого нужно пересчитать похожие рецепты."""
+    recipe_id = models.BigIntegerField('Рецепт')
+    queued_at = models.DateTimeField(
+        'Поставлен в очередь',
+        auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт к пересчету похожих'
+        verbose_name_plural = 'Рецепты к пересчету похожих'
+
+    def __str__(self):
+        return str(self.recipe_id)
+
+
+class ScoreEpoch(models.Model):
+    """Момент, к которому приведены счетчики популярности рецептов."""
+    moment = models.DateTimeField('Момент')
+
+    @classmethod
+    def current(cls):
+        epoch, _ = cls.objects.get_or_create(
+            pk=1, defaults={'moment': timezone.now()})
+        return epoch.moment
+
+    class Meta:
+        verbose_name = 'Отсчет популярности'
+        verbose_name_plural = 'Отсчет популярности'
+
+    def __str__(self):
+        return str(self.moment)
+
+
+class IndexVersion(models.Model):
+    """Версия данных, по которым воркеры строят индексы в памяти.
+
+    Увеличивается после фиксации изменений; воркер, увидевший новую
+    версию, перестраивает свою копию индекса.
+    """
+    name = models.CharField('Индекс', max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField('Версия', default=0)
+
+    @classmethod
+    def current(cls, name):
+        return (cls.objects.filter(name=name)
+                .values_list('version', flat=True).first() or 0)
+
+    @classmethod
+    def bump(cls, name):
+        """Увеличить версию индекса name и вернуть новую."""
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(name=name)], ignore_conflicts=True)
+            row = cls.objects.select_for_update().get(name=name)
+            row.version += 1
+            row.save(update_fields=['version'])
+        return row.version
+
+    class Meta:
+        verbose_name = 'Версия индекса'
+        verbose_name_plural = 'Версии индексов'
+
+    def __str__(self):
+        return f'{self.name} {self.version}'
+
+
+class IndexChange(models.Model):
+    """Рецепты, измененные в версии индекса (см. IndexVersion).
+
+    Воркер, отставший на несколько версий, перечитывает только эти
+    рецепты, а не перестраивает индекс целиком.
+    """
+    index = models.CharField('Индекс', max_length=50)
+    version = models.PositiveBigIntegerField('Версия')
+    recipe_ids = models.JSONField('Рецепты')
+
+    class Meta:
+        verbose_name = 'Изменение индекса'
+        verbose_name_plural = 'Изменения индексов'
+        constraints = [
+            models.UniqueConstraint(fields=['index', 'version'],
+                                    name='unique_index_change')
+        ]
+
+    def __str__(self):
+        return f'{self.index} {self.version}'
@@ -0,0 +1,100 @@
+from collections import defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .background import run_in_background
+from .models import (BASKET_WEIGHT, FAVORITE_WEIGHT, Basket, Favorite, Recipe,
+                     ScoreEpoch, epoch_is_stale, score_half_lives,
+                     time_weight)
+
+# Меньшие счетчики обнуляются при сдвиге отсчета, чтобы не обновлять
+# рецепты, которые давно никто не добавлял.
+MIN_SCORE = 1e-6
+BATCH_SIZE = 1000
+
+_decay_running = Lock()
+
+
+def lock_epoch(now):
+    epoch, _ = ScoreEpoch.objects.select_for_update().get_or_create(
+        pk=1, defaults={'moment': now})
+    return epoch
+
+
+def decay_scores(now=None):
+    """Сдвинуть отсчет к now, уменьшив все счетчики популярности.
+
+    Возвращает число обновленных рецептов.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        epoch = lock_epoch(now)
+        half_lives = score_half_lives()
+        scored = Q()
+        for field in half_lives:
+            scored |= ~Q(**{field: 0})
+        updated = Recipe.objects.filter(scored).update(**{
+            field: F(field) * time_weight(epoch.moment - now, half_life)
+            for field, half_life in half_lives.items()})
+        for field in half_lives:
+            Recipe.objects.filter(**{f'{field}__lt': MIN_SCORE}).exclude(
+                **{field: 0}).update(**{field: 0})
+        epoch.moment = now
+        epoch.save(update_fields=['moment'])
+    return updated
+
+
+def rebuild_scores(now=None):
+    """Пересчитать счетчики по времени добавления в избранное и корзины.
+
+    Возвращает число рецептов с ненулевой популярностью.
+    """
+    now = now or timezone.now()
+    half_lives = score_half_lives()
+    with transaction.atomic():
+        epoch = lock_epoch(now)
+        scores = defaultdict(lambda: dict.fromkeys(half_lives, 0.0))
+        for model, weight in ((Favorite, FAVORITE_WEIGHT),
+                              (Basket, BASKET_WEIGHT)):
+            for recipe_id, added_at in model.objects.values_list(
+                    'recipe_id', 'added_at').iterator(chunk_size=BATCH_SIZE):
+                for field, half_life in half_lives.items():
+                    scores[recipe_id][field] += weight * time_weight(
+                        added_at - now, half_life)
+        for field in half_lives:
+            Recipe.objects.exclude(**{field: 0}).update(**{field: 0})
+        Recipe.objects.bulk_update(
+            [Recipe(pk=pk, **values) for pk, values in scores.items()],
+            list(half_lives), batch_size=BATCH_SIZE)
+        epoch.moment = now
+        epoch.save(update_fields=['moment'])
+    return len(scores)
+
+
+def decay_stale_scores():
+    """Сдвинуть отсчет, если его еще не сдвинули."""
+    try:
+        now = timezone.now()
+        if epoch_is_stale(ScoreEpoch.current(), now):
+            decay_scores(now)
+    finally:
+        _decay_running.release()
+
+
+def start_decay():
+    if _decay_running.acquire(blocking=False):
+        run_in_background('recipe-scores', settings.SCORE_WORKERS,
+                          decay_stale_scores)
+
+
+def schedule_decay():
+    """Сдвинуть устаревший отсчет в фоне после фиксации транзакции.
+
+    Обновление всех рецептов не выполняется в запросе пользователя;
+    в процессе одновременно идет не больше одного сдвига.
+    """
+    transaction.on_commit(start_decay)
@@ -0,0 +1,175 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Полнотекстовый поиск по названию и описанию рецепта. Название весит
+# больше описания. В PostgreSQL поиск идет по столбцу search_vector с
+# GIN-индексом, в SQLite - по теневой таблице FTS5. Оба индекса
+# обновляются триггерами базы при изменении названия или описания.
+# Триггеры ставит миграция recipes 0016, а после каждого migrate их
+# наличие проверяет ensure_search_index: SQLite теряет триггеры, когда
+# миграция пересоздает таблицу рецептов.
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+WORD = re.compile(r'\w+')
+
+POSTGRESQL_TRIGGER = 'recipes_recipe_search_vector_trigger'
+POSTGRESQL_INSTALL = [
+    f"""
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{SEARCH_CONFIG}',
+                                  coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('{SEARCH_CONFIG}',
+                                     coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f'DROP TRIGGER IF EXISTS {POSTGRESQL_TRIGGER} ON recipes_recipe',
+    f"""
+    CREATE TRIGGER {POSTGRESQL_TRIGGER}
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update()
+    """,
+    # Триггер срабатывает только на запись названия или описания.
+    'UPDATE recipes_recipe SET name = name',
+    """
+    CREATE INDEX IF NOT EXISTS recipe_search_vector_idx
+    ON recipes_recipe USING gin (search_vector)
+    """,
+]
+POSTGRESQL_REMOVE = [
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    f'DROP TRIGGER IF EXISTS {POSTGRESQL_TRIGGER} ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()',
+]
+
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_insert': f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f'{FTS_TABLE}_delete': f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    f'{FTS_TABLE}_update': f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+}
+SQLITE_INSTALL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61')
+    """,
+    *SQLITE_TRIGGERS.values(),
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_REMOVE = [
+    *(f'DROP TRIGGER IF EXISTS {name}' for name in SQLITE_TRIGGERS),
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+STATEMENTS = {
+    'postgresql': (POSTGRESQL_INSTALL, POSTGRESQL_REMOVE),
+    'sqlite': (SQLITE_INSTALL, SQLITE_REMOVE),
+}
+
+
+def install_search_index(connection):
+    """Поставить триггеры и заново заполнить поисковый индекс."""
+    with connection.cursor() as cursor:
+        for statement in STATEMENTS.get(connection.vendor, ((), ()))[0]:
+            cursor.execute(statement)
+
+
+def remove_search_index(connection):
+    with connection.cursor() as cursor:
+        for statement in STATEMENTS.get(connection.vendor, ((), ()))[1]:
+            cursor.execute(statement)
+
+
+def search_index_installed(connection):
+    """Стоят ли все триггеры поискового индекса."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT count(*) FROM pg_trigger '
+                "WHERE tgrelid = 'recipes_recipe'::regclass AND tgname = %s",
+                [POSTGRESQL_TRIGGER])
+            return cursor.fetchone()[0] == 1
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                "AND tbl_name = 'recipes_recipe'")
+            return set(SQLITE_TRIGGERS) <= {name for name, in cursor}
+    return True
+
+
+def ensure_search_index(connection):
+    """Восстановить поисковый индекс, если триггеры пропали.
+
+    Возвращает True, если индекс пришлось восстановить. До миграции
+    recipes 0016 (нет столбца search_vector) ничего не делает.
+    """
+    introspection = connection.introspection
+    with connection.cursor() as cursor:
+        if 'recipes_recipe' not in introspection.table_names(cursor):
+            return False
+        columns = {column.name for column in
+                   introspection.get_table_description(
+                       cursor, 'recipes_recipe')}
+    if 'search_vector' not in columns or search_index_installed(connection):
+        return False
+    install_search_index(connection)
+    return True
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, от более релевантных к менее."""
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        query = SearchQuery(text, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        queryset = queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query))
+    elif vendor == 'sqlite':
+        # Каждое слово ищется как префикс; операторы FTS5 из запроса
+        # пользователя не передаются.
+        words = WORD.findall(text)
+        if not words:
+            return queryset.none()
+        match = ' '.join(f'"{word}"*' for word in words)
+        queryset = queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )).annotate(rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'AND {FTS_TABLE}.rowid = recipes_recipe.id',
+            (match,),
+        ))
+    else:
+        queryset = queryset.filter(
+            Q(name__icontains=text) | Q(text__icontains=text)
+        ).annotate(rank=Value(0.0))
+    return queryset.order_by('-rank', '-pub_date', '-id')
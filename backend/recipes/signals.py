@@ -0,0 +1,191 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from users.models import Subscribe
+
+from .background import after_commit
+from .feed import follower_added, follower_removed, schedule_fan_out
+from .images import VARIANT_SIZES, schedule_variants, variants_ready
+from .models import (BASKET_WEIGHT, FAVORITE_WEIGHT, RECIPE_EDITABLE_FIELDS,
+                     Basket, Favorite, IngredientRecipe, PendingMediaDeletion,
+                     PendingSimilarityUpdate, Recipe, ShoppingListItem,
+                     SimilarRecipe, TagRecipe)
+from .storage import ContentAddressedStorage
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_from_shopping_lists(sender, instance, **kwargs):
+    """Удаляемый рецепт уходит из списков покупок всех корзин."""
+    user_ids = list(instance.baskets.values_list('user_id', flat=True))
+    if user_ids:
+        ShoppingListItem.objects.change_amounts(
+            user_ids,
+            {pk: -amount for pk, amount in instance.get_amounts().items()})
+
+
+@receiver(post_save, sender=Recipe)
+def process_image(sender, instance, **kwargs):
+    """Новое изображение обрабатывается в пуле после фиксации транзакции."""
+    if instance.image and not variants_ready(instance):
+        transaction.on_commit(lambda: schedule_variants(instance.pk))
+
+
+def queue_media_deletion(names):
+    PendingMediaDeletion.objects.bulk_create(
+        [PendingMediaDeletion(name=name) for name in names if name])
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_replaced_image(sender, instance, update_fields=None, **kwargs):
+    instance._stored_image = None
+    if instance.pk is None or (
+            update_fields is not None and 'image' not in update_fields):
+        return
+    instance._stored_image = (Recipe.objects.filter(pk=instance.pk)
+                              .values_list('image', flat=True).first())
+    # Новый файл будет записан в хранилище при сохранении поля.
+    instance._image_uploaded = bool(
+        instance.image) and not instance.image._committed
+
+
+@receiver(post_save, sender=Recipe)
+def queue_replaced_image(sender, instance, **kwargs):
+    """Замененное изображение удаляется сборщиком после паузы.
+
+    Повторно загруженное то же изображение получает прежнее имя по
+    хешу; лишняя ссылка, которую добавило хранилище, снимается сразу.
+    Старые варианты освобождает обработчик изображений, когда
+    сохраняет варианты нового файла.
+    """
+    stored_image = getattr(instance, '_stored_image', None)
+    instance._stored_image = None
+    if not stored_image:
+        return
+    if stored_image != instance.image.name:
+        queue_media_deletion([stored_image])
+    elif instance._image_uploaded and isinstance(
+            instance.image.storage, ContentAddressedStorage):
+        instance.image.storage.delete(stored_image)
+
+
+@receiver(post_delete, sender=Recipe)
+def queue_deleted_images(sender, instance, **kwargs):
+    queue_media_deletion([instance.image.name] + [
+        name
+        for variant, formats in instance.image_variants.items()
+        if variant in VARIANT_SIZES
+        for name in formats.values()
+    ])
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_new_recipe(sender, instance, created, **kwargs):
+    """Новый рецепт раскладывается по лентам подписчиков в фоне."""
+    if created:
+        transaction.on_commit(lambda: schedule_fan_out(instance.pk))
+
+
+@receiver(post_save, sender=Subscribe)
+def fill_feed(sender, instance, created, **kwargs):
+    if created:
+        follower_added(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def clear_feed(sender, instance, **kwargs):
+    """После отписки рецепты автора уходят из ленты."""
+    follower_removed(instance.user_id, instance.following_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def sync_tag_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    """Маска тегов пересчитывается при каждом изменении тегов рецепта."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            masks = Recipe.objects.filter(pk=instance.pk).update_tag_masks()
+            # Экземпляр может быть сохранен позже целиком.
+            instance.tag_mask = masks.get(instance.pk, 0)
+    elif action == 'pre_clear':
+        instance._tagged_recipes = list(
+            instance.recipes.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        Recipe.objects.filter(
+            pk__in=instance._tagged_recipes).update_tag_masks()
+    elif action in ('post_add', 'post_remove'):
+        Recipe.objects.filter(pk__in=pk_set).update_tag_masks()
+
+
+@receiver(post_save, sender=TagRecipe)
+@receiver(post_delete, sender=TagRecipe)
+def sync_tag_mask_row(sender, instance, **kwargs):
+    """Строки TagRecipe, измененные напрямую (админка, удаление тега)."""
+    Recipe.objects.filter(pk=instance.recipe_id).update_tag_masks()
+
+
+def write_similarity_queue(recipe_ids):
+    PendingSimilarityUpdate.objects.bulk_create(
+        [PendingSimilarityUpdate(recipe_id=pk) for pk in recipe_ids])
+
+
+def queue_similarity_update(recipe_ids):
+    """Одна запись очереди на рецепт за транзакцию, после фиксации."""
+    after_commit(write_similarity_queue, recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved_for_similarity(sender, instance, update_fields=None,
+                                **kwargs):
+    """Ингредиенты пишутся вместе с сохранением всех полей автора."""
+    if update_fields is None or update_fields.issuperset(
+            RECIPE_EDITABLE_FIELDS):
+        queue_similarity_update([instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted_for_similarity(sender, instance, **kwargs):
+    """Рецепты, у которых удаляемый был среди похожих, пересчитываются."""
+    queue_similarity_update(SimilarRecipe.objects.filter(
+        similar=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def ingredient_row_saved_for_similarity(sender, instance, **kwargs):
+    queue_similarity_update([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_changed_for_similarity(sender, instance, action,
+                                              reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            queue_similarity_update([instance.pk])
+    elif action == 'pre_clear':
+        queue_similarity_update(
+            instance.recipes.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        queue_similarity_update(pk_set)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Basket)
+def activity_added(sender, instance, created, **kwargs):
+    """Корзины из add_recipes (bulk_create) учитываются там же."""
+    if created:
+        weight = FAVORITE_WEIGHT if sender is Favorite else BASKET_WEIGHT
+        Recipe.objects.filter(pk=instance.recipe_id).record_activity(
+            weight, instance.added_at)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Basket)
+def activity_removed(sender, instance, **kwargs):
+    """Снимается ровно тот вклад, что был добавлен.
+
+    Корзины из remove_recipes удаляются без сигналов и учитываются там.
+    """
+    weight = FAVORITE_WEIGHT if sender is Favorite else BASKET_WEIGHT
+    Recipe.objects.filter(pk=instance.recipe_id).record_activity(
+        -weight, instance.added_at)
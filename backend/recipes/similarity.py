@@ -0,0 +1,133 @@
+from collections import Counter, defaultdict
+from heapq import nlargest
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import IngredientRecipe, Recipe, SimilarRecipe
+
+
+def load_ingredients():
+    """Разреженная матрица рецепт x ингредиент и транспонированная к ней.
+
+    Строки - множества ингредиентов рецептов, столбцы - множества
+    рецептов с ингредиентом.
+    """
+    rows = defaultdict(set)
+    columns = defaultdict(set)
+    for recipe_id, ingredient_id in IngredientRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id').iterator(
+                chunk_size=settings.SIMILAR_RECIPES_CHUNK_SIZE):
+        rows[recipe_id].add(ingredient_id)
+        columns[ingredient_id].add(recipe_id)
+    return rows, columns
+
+
+def overlap(recipe_id, rows, columns):
+    """Число общих ингредиентов с каждым рецептом: строка A x A^T."""
+    common = Counter()
+    for ingredient_id in rows.get(recipe_id, ()):
+        common.update(columns[ingredient_id])
+    common.pop(recipe_id, None)
+    return common
+
+
+def jaccard(common, size, other_size):
+    return common / (size + other_size - common)
+
+
+def nearest(recipe_id, rows, common):
+    """Самые похожие рецепты по коэффициенту Жаккара: [(score, id)]."""
+    size = len(rows.get(recipe_id, ()))
+    return nlargest(settings.SIMILAR_RECIPES, (
+        (jaccard(count, size, len(rows[other])), other)
+        for other, count in common.items()))
+
+
+def chunks(items):
+    items = sorted(items)
+    size = settings.SIMILAR_RECIPES_CHUNK_SIZE
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def store(neighbours):
+    """Заменить списки похожих: {recipe_id: [(score, id)]}."""
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=neighbours).delete()
+        SimilarRecipe.objects.bulk_create(
+            [SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                           score=score)
+             for recipe_id, entries in neighbours.items()
+             for score, similar_id in entries],
+            batch_size=settings.SIMILAR_RECIPES_CHUNK_SIZE)
+
+
+def merge(stored, changed, rows, overlaps, recipe_id):
+    """Список похожих recipe_id после изменения рецептов changed.
+
+    None, если хранимого списка не хватает: изменившийся рецепт стал
+    менее похожим или пропал, а список был полным - неизвестно, какой
+    рецепт займет освободившееся место.
+    """
+    entries = {similar_id: score for score, similar_id in stored}
+    full = len(stored) >= settings.SIMILAR_RECIPES
+    size = len(rows.get(recipe_id, ()))
+    for changed_id in changed:
+        count = overlaps[changed_id].get(recipe_id, 0)
+        score = (jaccard(count, size, len(rows[changed_id]))
+                 if count else 0)
+        if full and score < entries.get(changed_id, 0):
+            return None
+        entries.pop(changed_id, None)
+        if score:
+            entries[changed_id] = score
+    return nlargest(settings.SIMILAR_RECIPES,
+                    ((score, pk) for pk, score in entries.items()))
+
+
+def update_similar_recipes(recipe_ids=None):
+    """Пересчитать похожие рецепты; None - для всех рецептов.
+
+    После изменения рецептов recipe_ids их списки считаются заново, а
+    в списки остальных рецептов изменившиеся рецепты вливаются по уже
+    посчитанной строке A x A^T. Запись идет порциями по
+    SIMILAR_RECIPES_CHUNK_SIZE рецептов. Возвращает число рецептов,
+    чьи списки переписаны.
+    """
+    rows, columns = load_ingredients()
+    existing = set(Recipe.objects.values_list('pk', flat=True))
+    overlaps = {}
+    updated = 0
+    if recipe_ids is None:
+        recompute = existing
+    else:
+        changed = set(recipe_ids) & existing
+        overlaps = {pk: overlap(pk, rows, columns) for pk in changed}
+        candidates = set(SimilarRecipe.objects.filter(
+            similar_id__in=changed).values_list('recipe_id', flat=True))
+        for common in overlaps.values():
+            candidates.update(common)
+        recompute = set(changed)
+        for chunk in chunks(candidates - changed):
+            stored = defaultdict(list)
+            for recipe_id, similar_id, score in (
+                    SimilarRecipe.objects.filter(recipe_id__in=chunk)
+                    .values_list('recipe_id', 'similar_id', 'score')):
+                stored[recipe_id].append((score, similar_id))
+            neighbours = {}
+            for recipe_id in chunk:
+                old = sorted(stored[recipe_id], reverse=True)
+                new = merge(old, changed, rows, overlaps, recipe_id)
+                if new is None:
+                    recompute.add(recipe_id)
+                elif new != old:
+                    neighbours[recipe_id] = new
+            store(neighbours)
+            updated += len(neighbours)
+    for chunk in chunks(recompute):
+        store({recipe_id: nearest(
+            recipe_id, rows,
+            overlaps.get(recipe_id) or overlap(recipe_id, rows, columns))
+            for recipe_id in chunk})
+    return updated + len(recompute)
@@ -0,0 +1,92 @@
+import os
+import posixpath
+import re
+from hashlib import sha256
+from uuid import uuid4
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+CONTENT_ADDRESSED_NAME = re.compile(
+    r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[^/]*)?$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище медиафайлов с именами по хешу содержимого.
+
+    Файл recipes/image/photo.png сохраняется как
+    recipes/image/ab/cd/abcd....png: одинаковые файлы записываются
+    на диск один раз, а MediaFile считает ссылки на них. delete()
+    уменьшает счетчик и удаляет файл, когда ссылок не осталось.
+    """
+
+    @staticmethod
+    def is_content_addressed(name):
+        return bool(CONTENT_ADDRESSED_NAME.search(name))
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым в _save.
+        return name
+
+    def _save(self, name, content):
+        from .models import MediaFile
+
+        digest = sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = os.path.splitext(filename)[1].lower()
+        name = posixpath.join(directory, digest[:2], digest[2:4],
+                              digest + extension)
+        with transaction.atomic():
+            if not MediaFile.objects.filter(name=name).update(
+                    ref_count=F('ref_count') + 1):
+                try:
+                    with transaction.atomic():
+                        MediaFile.objects.create(name=name, ref_count=1)
+                except IntegrityError:
+                    MediaFile.objects.filter(name=name).update(
+                        ref_count=F('ref_count') + 1)
+            if not self.exists(name):
+                self._write(name, content)
+        return name
+
+    def _write(self, name, content):
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True,
+                    mode=self.directory_permissions_mode or 0o777)
+        # Одинаковое содержимое можно безопасно перезаписать атомарно.
+        temp_path = f'{full_path}.{uuid4().hex}.tmp'
+        content.seek(0)
+        with open(temp_path, 'wb') as file:
+            for chunk in content.chunks():
+                file.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(temp_path, self.file_permissions_mode)
+        os.replace(temp_path, full_path)
+
+    def delete(self, name):
+        from .models import MediaFile
+
+        with transaction.atomic():
+            media_file = (MediaFile.objects.select_for_update()
+                          .filter(name=name).first())
+            if media_file is not None and media_file.ref_count > 1:
+                media_file.ref_count = F('ref_count') - 1
+                media_file.save(update_fields=['ref_count'])
+                return
+            if media_file is not None:
+                media_file.delete()
+            # Файл удаляется под блокировкой строки, чтобы параллельное
+            # сохранение того же содержимого записало его заново.
+            super().delete(name)
+
+    def purge(self, name):
+        """Удалить файл независимо от счетчика ссылок."""
+        from .models import MediaFile
+
+        with transaction.atomic():
+            MediaFile.objects.filter(name=name).delete()
+            super().delete(name)
@@ -0,0 +1,65 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.tests.factories import make_recipe, make_user
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscribe
+
+
+@override_settings(FEED_WORKERS=0, IMAGE_VARIANT_WORKERS=0,
+                   FEED_MAX_FANOUT_FOLLOWERS=1)
+class FanOutThresholdTests(TestCase):
+
+    def setUp(self):
+        self.author = make_user('author')
+        self.first, self.second = make_user('first'), make_user('second')
+        self.recipe = make_recipe(self.author, 'Суп')
+
+    def subscribe(self, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Subscribe.objects.create(user=user,
+                                            following=self.author)
+
+    def feed(self, user):
+        return list(Recipe.objects.in_feed_of(user, 1)
+                    .values_list('pk', flat=True))
+
+    def entries(self):
+        return FeedEntry.objects.filter(recipe__author=self.author).count()
+
+    def follower_count(self):
+        self.author.refresh_from_db(fields=['follower_count'])
+        return self.author.follower_count
+
+    def test_counter_follows_subscriptions(self):
+        subscription = self.subscribe(self.first)
+        self.assertEqual(self.follower_count(), 1)
+        subscription.delete()
+        self.assertEqual(self.follower_count(), 0)
+
+    def test_crossing_up_clears_entries_without_gaps(self):
+        self.subscribe(self.first)
+        self.assertEqual(self.entries(), 1)
+        self.subscribe(self.second)
+        self.assertEqual(self.entries(), 0)
+        self.assertEqual(self.feed(self.first), [self.recipe.pk])
+        self.assertEqual(self.feed(self.second), [self.recipe.pk])
+
+    def test_crossing_down_backfills_followers(self):
+        self.subscribe(self.first)
+        subscription = self.subscribe(self.second)
+        with self.captureOnCommitCallbacks(execute=True):
+            subscription.delete()
+        self.assertEqual(
+            list(FeedEntry.objects.values_list('user_id', 'recipe_id')),
+            [(self.first.pk, self.recipe.pk)])
+        self.assertEqual(self.feed(self.first), [self.recipe.pk])
+        self.assertEqual(self.feed(self.second), [])
+
+    def test_feed_read_does_not_count_followers(self):
+        self.subscribe(self.first)
+        with CaptureQueriesContext(connection) as queries:
+            self.feed(self.first)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT(', queries[0]['sql'].upper())
@@ -0,0 +1,50 @@
+import posixpath
+from io import BytesIO
+from tempfile import TemporaryDirectory
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from recipes.images import VARIANTS_DIR, render_variants
+from recipes.storage import ContentAddressedStorage
+
+
+def png(color):
+    buffer = BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+class VariantNameTests(TestCase):
+
+    def setUp(self):
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_variants_are_sharded_by_digest(self):
+        variants = render_variants(
+            default_storage.save('recipes/image/photo.png', png('red')))
+        for variant, formats in variants.items():
+            if variant == 'source':
+                continue
+            for name in formats.values():
+                self.assertTrue(
+                    ContentAddressedStorage.is_content_addressed(name))
+                directory = posixpath.dirname(name)
+                self.assertEqual(directory.rsplit('/', 2)[0],
+                                 f'{VARIANTS_DIR}/{variant}')
+
+    def test_images_do_not_get_their_own_directory(self):
+        first = render_variants(
+            default_storage.save('recipes/image/a.png', png('red')))
+        second = render_variants(
+            default_storage.save('recipes/image/b.png', png('blue')))
+        shared = f'{VARIANTS_DIR}/card'
+        self.assertTrue(first['card']['webp'].startswith(shared))
+        self.assertTrue(second['card']['webp'].startswith(shared))
+        self.assertNotEqual(first['card']['webp'], second['card']['webp'])
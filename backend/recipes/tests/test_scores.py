@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api.tests.factories import make_recipe, make_user, synchronous
+from recipes.models import Basket, Favorite, Recipe, ScoreEpoch
+from recipes.scores import decay_scores, rebuild_scores
+
+
+@synchronous
+class RecipeScoreTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.user = make_user('user')
+        cls.recipe = make_recipe(cls.author, 'Суп')
+
+    def scores(self):
+        return Recipe.objects.filter(pk=self.recipe.pk).values_list(
+            'popular_score', 'trending_score').get()
+
+    def assert_scores(self, expected):
+        for score in self.scores():
+            self.assertAlmostEqual(score, expected, places=6)
+
+    def test_add_and_remove_cancel_out(self):
+        favorite = Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Basket.objects.add_recipes(self.user, [self.recipe.pk])
+        self.assertGreater(min(self.scores()), 0)
+        favorite.delete()
+        Basket.objects.remove_recipes(self.user, [self.recipe.pk])
+        self.assert_scores(0)
+
+    def test_removal_after_rebase_cancels_out(self):
+        favorite = Favorite.objects.create(user=self.user, recipe=self.recipe)
+        decay_scores(timezone.now() + timedelta(days=3))
+        favorite.delete()
+        self.assert_scores(0)
+
+    def test_old_epoch_is_rebased_after_commit(self):
+        ScoreEpoch.objects.update_or_create(
+            pk=1, defaults={'moment': timezone.now() - timedelta(days=40)})
+        with self.captureOnCommitCallbacks() as callbacks:
+            Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.assertGreater(timezone.now() - ScoreEpoch.current(),
+                           timedelta(days=39))
+        for callback in callbacks:
+            callback()
+        self.assertLess(timezone.now() - ScoreEpoch.current(),
+                        timedelta(minutes=1))
+        self.assert_scores(1)
+
+    def test_cart_removal_is_batched(self):
+        recipes = [self.recipe] + [make_recipe(self.author, f'Рецепт {n}')
+                                   for n in range(4)]
+
+        def remove(count, recipe_ids):
+            Basket.objects.add_recipes(
+                self.user, [recipe.pk for recipe in recipes[:count]])
+            with self.assertNumQueries(8):
+                Basket.objects.remove_recipes(self.user, recipe_ids)
+
+        remove(1, [self.recipe.pk])
+        remove(5, [recipe.pk for recipe in recipes])
+        remove(5, None)
+        self.assertEqual(
+            set(Recipe.objects.values_list('popular_score', flat=True)),
+            {0})
+
+    def test_rebuild_matches_incremental_scores(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Basket.objects.add_recipes(self.user, [self.recipe.pk])
+        incremental = self.scores()
+        rebuild_scores(ScoreEpoch.current())
+        for rebuilt, expected in zip(self.scores(), incremental):
+            self.assertAlmostEqual(rebuilt, expected, places=6)
@@ -0,0 +1,60 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from api.tests.factories import make_recipe, make_user, synchronous
+from recipes.models import Recipe
+from recipes.search import (ensure_search_index, remove_search_index,
+                            search_index_installed, search_recipes)
+
+
+def found(text):
+    return list(search_recipes(Recipe.objects.all(), text)
+                .values_list('name', flat=True))
+
+
+@synchronous
+class SearchIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        make_recipe(cls.author, 'Салат', text='Добавить грибы')
+        cls.soup = make_recipe(cls.author, 'Грибы в супе',
+                               text='Сварить суп')
+
+    def test_triggers_are_installed_after_migrate(self):
+        self.assertTrue(search_index_installed(connection))
+        self.assertFalse(ensure_search_index(connection))
+
+    def test_name_ranks_above_text(self):
+        self.assertEqual(found('грибы'), ['Грибы в супе', 'Салат'])
+
+    def test_edit_updates_index(self):
+        self.soup.name = 'Борщ'
+        self.soup.save()
+        self.assertEqual(found('борщ'), ['Борщ'])
+        self.assertEqual(found('грибы'), ['Салат'])
+
+    def test_score_update_keeps_index(self):
+        Recipe.objects.filter(pk=self.soup.pk).update(popular_score=5)
+        self.assertEqual(found('суп'), ['Грибы в супе'])
+
+    def test_lost_triggers_are_restored(self):
+        remove_search_index(connection)
+        self.assertFalse(search_index_installed(connection))
+        self.assertTrue(ensure_search_index(connection))
+        self.assertEqual(found('салат'), ['Салат'])
+        make_recipe(self.author, 'Плов')
+        self.assertEqual(found('плов'), ['Плов'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL FTS')
+    def test_postgresql_vector_follows_name_and_text_only(self):
+        vector = Recipe.objects.filter(pk=self.soup.pk).values_list(
+            'search_vector', flat=True)
+        before = vector.get()
+        Recipe.objects.filter(pk=self.soup.pk).update(trending_score=3)
+        self.assertEqual(vector.get(), before)
+        Recipe.objects.filter(pk=self.soup.pk).update(text='Тыква')
+        self.assertNotEqual(vector.get(), before)
@@ -0,0 +1,77 @@
+from io import StringIO
+from random import Random
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from api.tests.factories import (make_ingredient, make_recipe, make_user,
+                                 synchronous)
+from recipes.models import (IngredientRecipe, PendingSimilarityUpdate,
+                            Recipe, SimilarRecipe)
+
+
+def snapshot():
+    return sorted(SimilarRecipe.objects.values_list(
+        'recipe_id', 'similar_id', 'score'))
+
+
+@synchronous
+@override_settings(SIMILAR_RECIPES=3, SIMILAR_RECIPES_CHUNK_SIZE=4)
+class SimilarRecipesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        random = Random(7)
+        author = make_user('author')
+        cls.ingredients = [make_ingredient(f'ингредиент {number}')
+                           for number in range(12)]
+        cls.recipes = [
+            make_recipe(author, f'Рецепт {number}',
+                        random.sample(cls.ingredients, random.randint(2, 6)))
+            for number in range(20)]
+
+    def update(self, full=False):
+        call_command('update_similar_recipes', full=full, stdout=StringIO())
+
+    def assert_incremental_matches_full(self):
+        self.update()
+        self.assertFalse(PendingSimilarityUpdate.objects.exists())
+        incremental = snapshot()
+        self.update(full=True)
+        self.assertEqual(incremental, snapshot())
+
+    def test_detail_endpoint(self):
+        self.update(full=True)
+        recipe = self.recipes[0]
+        response = self.client.get(f'/api/recipes/{recipe.pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['id'] for item in response.json()],
+            list(SimilarRecipe.objects.filter(recipe=recipe)
+                 .order_by('-score', '-similar_id')
+                 .values_list('similar_id', flat=True)))
+
+    def test_invalid_id_is_not_found(self):
+        for pk in ('abc', '999999'):
+            response = self.client.get(f'/api/recipes/{pk}/similar/')
+            self.assertEqual(response.status_code, 404)
+
+    def test_changed_ingredients(self):
+        self.update(full=True)
+        changed = self.recipes[3]
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.filter(recipe=changed).delete()
+            IngredientRecipe.objects.bulk_create(
+                [IngredientRecipe(recipe=changed, ingredient=ingredient,
+                                  amount=1)
+                 for ingredient in self.ingredients[:5]])
+            changed.save()
+        self.assert_incremental_matches_full()
+
+    def test_new_and_deleted_recipes(self):
+        self.update(full=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_recipe(self.recipes[0].author, 'Новый',
+                        self.ingredients[4:9])
+            Recipe.objects.filter(pk=self.recipes[5].pk).get().delete()
+        self.assert_incremental_matches_full()
@@ -0,0 +1,59 @@
+from base64 import b64encode
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.tests.factories import (make_ingredient, make_recipe, make_tag,
+                                 make_user, synchronous)
+from recipes.models import MediaFile, Recipe
+from recipes.tests.test_images import png
+
+
+@synchronous
+class MediaReferenceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.tag = make_tag('breakfast')
+        cls.salt = make_ingredient('соль')
+        cls.recipe = make_recipe(cls.author, 'Суп', [cls.salt], [cls.tag])
+
+    def setUp(self):
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def edit(self, color):
+        image = b64encode(png(color).read()).decode()
+        response = self.client.put(f'/api/recipes/{self.recipe.pk}/', {
+            'name': 'Суп', 'text': 'Суп', 'cooking_time': 10,
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.salt.pk, 'amount': 100}],
+            'image': f'data:image/png;base64,{image}',
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return Recipe.objects.get(pk=self.recipe.pk).image.name
+
+    def ref_count(self, name):
+        return MediaFile.objects.get(name=name).ref_count
+
+    def test_same_image_is_referenced_once(self):
+        name = self.edit('red')
+        self.assertEqual(self.edit('red'), name)
+        self.assertEqual(self.edit('red'), name)
+        self.assertEqual(self.ref_count(name), 1)
+
+    def test_scan_restores_reference_counts(self):
+        name = self.edit('red')
+        MediaFile.objects.filter(name=name).update(ref_count=5)
+        call_command('collect_media', scan=True, grace_hours=-1,
+                     stdout=StringIO())
+        self.assertEqual(self.ref_count(name), 1)
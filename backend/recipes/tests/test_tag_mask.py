@@ -0,0 +1,50 @@
+from django.test import TestCase
+
+from api.tests.factories import make_recipe, make_tag, make_user, synchronous
+from recipes.models import Recipe, tag_mask
+
+
+@synchronous
+class TagMaskTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = make_user('author')
+        cls.breakfast, cls.lunch, cls.dinner = (
+            make_tag(slug) for slug in ('breakfast', 'lunch', 'dinner'))
+        cls.eggs = make_recipe(author, 'Яичница', tags=[cls.breakfast])
+        cls.soup = make_recipe(author, 'Суп',
+                               tags=[cls.breakfast, cls.lunch])
+        cls.steak = make_recipe(author, 'Стейк', tags=[cls.dinner])
+
+    def stored_mask(self, recipe):
+        return Recipe.objects.values_list('tag_mask', flat=True).get(
+            pk=recipe.pk)
+
+    def assert_mask_matches_tags(self, *recipes):
+        for recipe in recipes:
+            self.assertEqual(
+                self.stored_mask(recipe),
+                tag_mask(recipe.tags.values_list('pk', flat=True)))
+
+    def test_mask_follows_tag_changes(self):
+        self.assert_mask_matches_tags(self.eggs, self.soup, self.steak)
+        self.soup.tags.remove(self.breakfast)
+        self.eggs.tags.add(self.dinner)
+        self.steak.tags.clear()
+        self.assert_mask_matches_tags(self.eggs, self.soup, self.steak)
+        self.assertEqual(self.stored_mask(self.steak), 0)
+
+    def test_clearing_a_tag_updates_its_recipes(self):
+        self.breakfast.recipes.clear()
+        self.assert_mask_matches_tags(self.eggs, self.soup)
+
+    def test_filter_matches_join_without_duplicates(self):
+        response = self.client.get(
+            '/api/recipes/', {'tags': ['breakfast', 'lunch'], 'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(item['id'] for item in response.json()['results']),
+            sorted(Recipe.objects.filter(
+                tags__slug__in=['breakfast', 'lunch']
+            ).distinct().values_list('pk', flat=True)))
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_followers(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    followers = Subscribe.objects.filter(
+        following=OuterRef('pk')
+    ).values('following').annotate(total=Count('pk')).values('total')
+    User.objects.update(follower_count=Coalesce(Subquery(followers), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_subscribe_нельзя_подписываться_на_себя'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.RunPython(count_followers, migrations.RunPython.noop),
+    ]
@@ -38,6 +38,12 @@ class User(AbstractUser):
         max_length=150,
         help_text='Введите пароль'
     )
+    # Поддерживается сигналами Subscribe (см. recipes.feed).
+    follower_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         """Каждый логин может быть привязан к определенному email."""